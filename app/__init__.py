@@ -1,7 +1,23 @@
-from flask import Flask, jsonify, request
+import json
+import math
+import queue
+
+from flask import Flask, Response, jsonify, request
 from decouple import config
 
-from .validator import Email
+from .validator import VALIDATION_MAX_TIME_BUDGET, Email
+from .batch import (
+    BATCH_MAX_EMAILS,
+    BATCH_STREAM_MAX_EMAILS,
+    iter_batch_results,
+    validate_batch,
+)
+from .jobs import JOB_MAX_EMAILS, JOB_MAX_WAIT, job_queue
+from .retry_scheduler import retry_scheduler
+from .dns_cache import dns_cache
+from .domain_profile import domain_profiles, catch_all_verdicts
+from .smtp_probe import smtp_pool
+from .smtp_throttle import smtp_throttles
 
 app = Flask(__name__)
 
@@ -13,40 +29,202 @@ def home():
     return jsonify({"message": "Not allowed"}), 405
 
 
-@app.route("/validate", methods=["POST"])
-def validate_email():
+# Keys that are only returned to requests for debugging
+DEBUG_KEYS = [
+    "autodiscover_domain",
+    "autodiscover_host",
+    "autodiscover_host_tld",
+    "is_catch_all_test",
+    "phrase_matches",
+    "smtp_response",
+    "catch_all_smtp_response",
+    "smtp_throttle_timeout",
+]
+
+
+# Returns the emails parameter of the request and None if it is valid,
+# None and the error response otherwise
+def get_emails(data, max_emails):
+    emails = data.get("emails")
+    if not isinstance(emails, list) or not all(
+        isinstance(email, str) for email in emails
+    ):
+        return None, (
+            jsonify({"error": "Emails parameter must be a list of email addresses"}),
+            400,
+        )
+
+    if len(emails) > max_emails:
+        return None, (
+            jsonify({"error": f"At most {max_emails} emails can be validated at once"}),
+            400,
+        )
+
+    return emails, None
+
+
+# Returns the time_budget parameter of the request, None if it isn't given,
+# and None if it is valid, the error response otherwise
+def get_time_budget(data):
+    time_budget = data.get("time_budget")
+    if time_budget is None:
+        return None, None
+
+    try:
+        time_budget = float(time_budget)
+    except (TypeError, ValueError):
+        time_budget = 0
+
+    # NaN would pass the comparison below, and neither NaN nor infinity is a budget
+    if not math.isfinite(time_budget) or time_budget <= 0:
+        return None, (
+            jsonify({"error": "Time budget parameter must be a positive number"}),
+            400,
+        )
+
+    return min(time_budget, VALIDATION_MAX_TIME_BUDGET), None
+
+
+# Returns the JSON body of the request and None if it is authorized,
+# None and the error response otherwise
+def get_authorized_json():
     try:
         data = request.get_json()
     except Exception as e:
-        return jsonify({"error": "Invalid JSON format", "message": str(e)}), 400
+        return None, (jsonify({"error": "Invalid JSON format", "message": str(e)}), 400)
 
     if not data or "api_key" not in data:
-        return jsonify({"error": "Unauthorized!"}), 401
+        return None, (jsonify({"error": "Unauthorized!"}), 401)
 
     if data["api_key"] != API_KEY:
-        return jsonify({"error": "Unauthorized!"}), 401
+        return None, (jsonify({"error": "Unauthorized!"}), 401)
+
+    return data, None
+
+
+# If this is not a request for debugging, remove some keys
+def remove_debug_keys(result, data):
+    is_debug = data.get("debug", False)
+    if not is_debug:
+        for key in DEBUG_KEYS:
+            result.pop(key, None)
+    return result
+
+
+@app.route("/validate", methods=["POST"])
+def validate_email():
+    data, error = get_authorized_json()
+    if error:
+        return error
 
     if "email" not in data:
         return jsonify({"error": "Email parameter is missing"}), 400
 
-    email = Email(data["email"])
+    # Seconds the validation can take, stages are skipped when they run short
+    time_budget, error = get_time_budget(data)
+    if error:
+        return error
 
-    result = email.validate()
+    email = Email(
+        data["email"], time_budget=time_budget, debug=data.get("debug", False)
+    )
 
-    # If this is not a request for debugging, remove some keys
-    is_debug = data.get("debug", False)
-    if not is_debug:
-        result.pop("autodiscover_domain", None)
-        result.pop("autodiscover_host", None)
-        result.pop("autodiscover_host_tld", None)
-        result.pop("is_catch_all_test", None)
-        result.pop("phrase_matches", None)
-        result.pop("smtp_response", None)
+    result = remove_debug_keys(email.validate(), data)
 
     print(result)
     return jsonify(result)
 
 
+@app.route("/validate/batch", methods=["POST"])
+def validate_email_batch():
+    data, error = get_authorized_json()
+    if error:
+        return error
+
+    # In streaming mode, each result is sent as a JSON line as soon as it is ready
+    is_stream = data.get("stream", False)
+    emails, error = get_emails(
+        data, BATCH_STREAM_MAX_EMAILS if is_stream else BATCH_MAX_EMAILS
+    )
+    if error:
+        return error
+
+    if is_stream:
+        return Response(
+            stream_batch_results(emails, data), mimetype="application/x-ndjson"
+        )
+
+    results = [remove_debug_keys(result, data) for result in validate_batch(emails)]
+
+    return jsonify({"results": results})
+
+
+# Yields a JSON line for each result, tagged with the index of the email in the request
+def stream_batch_results(emails, data):
+    for index, result in iter_batch_results(emails):
+        line = {"index": index, "result": remove_debug_keys(result, data)}
+        yield json.dumps(line) + "\n"
+
+
+# Queues a list of emails for validation in the background and returns the job id to poll
+@app.route("/jobs", methods=["POST"])
+def submit_job():
+    data, error = get_authorized_json()
+    if error:
+        return error
+
+    emails, error = get_emails(data, JOB_MAX_EMAILS)
+    if error:
+        return error
+
+    try:
+        job = job_queue.submit(emails, {"debug": data.get("debug", False)})
+    except queue.Full:
+        return jsonify({"error": "Too many jobs are waiting, try again later"}), 503
+
+    return jsonify({"id": job.id, "status": job.status, "total": len(emails)}), 202
+
+
+# Returns the progress of a job and the results that finished after the first `since` ones
+# With `wait`, waits up to that many seconds for new results before responding
+@app.route("/jobs/<job_id>", methods=["POST"])
+def poll_job(job_id):
+    data, error = get_authorized_json()
+    if error:
+        return error
+
+    try:
+        since = max(int(data.get("since", 0)), 0)
+        wait = min(max(float(data.get("wait", 0)), 0), JOB_MAX_WAIT)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Since and wait parameters must be numbers"}), 400
+
+    snapshot = job_queue.snapshot(job_id, since, wait)
+    if snapshot is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    options = snapshot.pop("options")
+    snapshot["results"] = [
+        {"index": index, "result": remove_debug_keys(dict(result), options)}
+        for index, result in snapshot["results"]
+    ]
+    return jsonify(snapshot)
+
+
 @app.route("/status", methods=["GET"])
 def status():
-    return jsonify({"status": "OK"}), 200
+    return (
+        jsonify(
+            {
+                "status": "OK",
+                "dns_cache": dns_cache.stats(),
+                "domain_profiles": domain_profiles.stats(),
+                "catch_all_verdicts": catch_all_verdicts.stats(),
+                "jobs": job_queue.stats(),
+                "retries": retry_scheduler.stats(),
+                "smtp_pool": smtp_pool.stats(),
+                "smtp_throttles": smtp_throttles.stats(),
+            }
+        ),
+        200,
+    )
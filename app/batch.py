@@ -0,0 +1,187 @@
+import queue
+
+from decouple import config
+
+from .concurrency import map_concurrently, spawn_dedicated
+from .smtp_probe import SMTP_MAX_RECIPIENTS_PER_SESSION, check_recipients
+from .validator import SMTP_ERROR_DETAIL, Email
+
+# Maximum number of emails accepted in one batch request
+BATCH_MAX_EMAILS = config("BATCH_MAX_EMAILS", default=1000, cast=int)
+
+# Maximum number of emails accepted in one streaming batch request
+BATCH_STREAM_MAX_EMAILS = config("BATCH_STREAM_MAX_EMAILS", default=100000, cast=int)
+
+# Number of emails a streaming batch works on at once, this bounds its memory use
+BATCH_STREAM_WINDOW_SIZE = config("BATCH_STREAM_WINDOW_SIZE", default=500, cast=int)
+
+# Number of domains resolved, or mail servers talked to, at the same time for a batch
+BATCH_CONCURRENCY = config("BATCH_CONCURRENCY", default=10, cast=int)
+
+
+# Validates a list of email addresses, returns their results in the same order
+def validate_batch(addresses):
+    results = [None] * len(addresses)
+    for index, result in iter_batch_results(addresses, len(addresses)):
+        results[index] = result
+    return results
+
+
+# Validates a list of email addresses and yields (index in the list, result) for each of them
+# as soon as it is ready, so not in the order of the list
+# The list is worked on window_size emails at a time
+def iter_batch_results(addresses, window_size=BATCH_STREAM_WINDOW_SIZE):
+    window_size = max(window_size, 1)
+
+    for start in range(0, len(addresses), window_size):
+        finished = queue.Queue()
+        # The window waits for tasks of the shared executor, so it doesn't run on it
+        task = spawn_dedicated(
+            validate_window, addresses[start : start + window_size], start, finished.put
+        )
+
+        # None marks the end of the window
+        for item in iter(finished.get, None):
+            yield item
+
+        # Raises if the window failed
+        task.get()
+
+
+# Validates a window of the batch, calls emit((index, result)) for each email when it is ready
+# Each domain is resolved once and the emails served by the same mail server are checked
+# together, several RCPT TO per SMTP session
+def validate_window(addresses, offset, emit):
+    try:
+        emails = [
+            (offset + position, Email(address))
+            for position, address in enumerate(addresses)
+        ]
+
+        needs_smtp = run_checks_before_smtp(emails, emit)
+
+        # Group the emails by the mail server they are delivered to
+        groups = {}
+        for index, email in needs_smtp:
+            groups.setdefault(email.smtp_provider_host.lower(), []).append(
+                (index, email)
+            )
+
+        map_concurrently(
+            lambda group: check_group(group, emit),
+            list(groups.items()),
+            BATCH_CONCURRENCY,
+        )
+
+    finally:
+        emit(None)
+
+
+# Runs the checks before the SMTP conversation on (index, email) pairs
+# Emits the emails that got a verdict and returns the ones that still need the SMTP conversation
+def run_checks_before_smtp(emails, emit):
+    def check(item, domain_profile=None):
+        index, email = item
+        needs_smtp = email.run_checks_before_smtp(domain_profile)
+        if not needs_smtp:
+            emit((index, email.results()))
+        return needs_smtp
+
+    def get_domain(item):
+        return item[1].email.rsplit("@", 1)[-1].lower()
+
+    # The first email of each domain goes first, concurrently, so each domain is resolved once
+    first_by_domain = {}
+    for item in emails:
+        first_by_domain.setdefault(get_domain(item), item)
+    first = list(first_by_domain.values())
+
+    needs_smtp = dict(
+        zip(
+            (index for index, _ in first),
+            map_concurrently(check, first, BATCH_CONCURRENCY),
+        )
+    )
+
+    # The others reuse the profile of the first email of their domain, even one that isn't cached,
+    # e.g. after a DNS timeout
+    # It is missing if the first email failed the syntax check, then the others get it from the cache
+    profiles = {
+        domain: email._domain_profile for domain, (_, email) in first_by_domain.items()
+    }
+    others = [item for item in emails if item[0] not in needs_smtp]
+    needs_smtp.update(
+        zip(
+            (index for index, _ in others),
+            map_concurrently(
+                lambda item: check(item, profiles[get_domain(item)]),
+                others,
+                BATCH_CONCURRENCY,
+            ),
+        )
+    )
+
+    return [(index, email) for index, email in emails if needs_smtp[index]]
+
+
+# Number of RCPT TO commands a session sends for these (email, catch-all test address) pairs
+# The catch-all test address of a domain is only sent once per session
+def count_rcpt_commands(recipients):
+    catch_all_tests = {test for _, test in recipients if test is not None}
+    return len(recipients) + len(catch_all_tests)
+
+
+# Splits the (index, email) pairs of a mail server into sessions that stay within the recipient limit
+# Sessions are generated one at a time, so that the catch-all verdicts found by the
+# previous session are known when the next one is planned
+def split_into_sessions(emails):
+    recipients = []
+
+    for item in emails:
+        recipient = (item, item[1].get_catch_all_test_email())
+
+        if (
+            recipients
+            and count_rcpt_commands(recipients + [recipient])
+            > SMTP_MAX_RECIPIENTS_PER_SESSION
+        ):
+            yield recipients
+            recipients = []
+            recipient = (item, item[1].get_catch_all_test_email())
+
+        recipients.append(recipient)
+
+    if recipients:
+        yield recipients
+
+
+# Checks all emails of a mail server, in as few sessions as the recipient limit allows
+# Emits each email when its session is evaluated
+def check_group(group, emit):
+    host, emails = group
+    provider = emails[0][1].email_provider
+
+    for recipients in split_into_sessions(emails):
+        session = check_recipients(
+            host,
+            [
+                (email.email, catch_all_test_email)
+                for (_, email), catch_all_test_email in recipients
+            ],
+            provider=provider,
+        )
+
+        for (index, email), catch_all_test_email in recipients:
+            email.smtp_response = session.responses_for(email.email)
+            email.catch_all_smtp_response = session.catch_all_tests.get(
+                catch_all_test_email, {}
+            )
+            email.smtp_throttle_timeout = session.is_throttle_timeout
+
+            try:
+                email.evaluate_smtp_response()
+            except Exception as e:
+                email.status = "unknown"
+                email.status_detail = SMTP_ERROR_DETAIL
+
+            emit((index, email.results()))
@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Marks a missing entry, so that falsy values can be cached too
+_MISSING = object()
+
+
+# A bounded in-process cache where each entry expires after its own TTL
+# When the cache is full, the least recently used entry is evicted
+class TTLCache:
+    def __init__(self, max_size, ttl=None):
+        # Maximum number of entries kept at once
+        self.max_size = max_size
+
+        # Default lifetime of an entry in seconds, None means no expiry
+        self.ttl = ttl
+
+        # key -> (expires_at, value), ordered from least to most recently used
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        # key -> lock held while the value for that key is being computed
+        self._pending = {}
+
+        # Counters for reporting
+        self.hits = 0
+        self.misses = 0
+
+    # Returns the cached value or default if it is missing or expired
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+
+                # Expired, drop it
+                del self._entries[key]
+
+            self.misses += 1
+            return default
+
+    # Stores a value, ttl overrides the default lifetime of the cache
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+
+        # A non-positive TTL means the value should not be cached at all
+        if ttl is not None and ttl <= 0:
+            return
+
+        expires_at = None if ttl is None else time.monotonic() + ttl
+
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    # Returns the cached value, or computes it with factory and caches it
+    # Concurrent callers for the same key wait for the first one instead of computing it again
+    # ttl can be a function of the computed value
+    def get_or_set(self, key, factory, ttl=None):
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        with self._lock:
+            pending = self._pending.setdefault(key, threading.Lock())
+
+        try:
+            with pending:
+                # Someone else may have computed it while we were waiting
+                value = self._peek(key)
+                if value is _MISSING:
+                    value = factory()
+                    self.set(key, value, ttl(value) if callable(ttl) else ttl)
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+        return value
+
+    # Same as get, without updating the counters or the recency of the entry
+    def _peek(self, key):
+        with self._lock:
+            expires_at, value = self._entries.get(key, (None, _MISSING))
+            if expires_at is not None and expires_at <= time.monotonic():
+                return _MISSING
+            return value
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Returns a dict with the counters of the cache
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,82 @@
+import concurrent.futures
+
+from decouple import config
+
+try:
+    import gevent
+    import gevent.pool
+    from gevent import monkey
+except ImportError:
+    gevent = None
+
+# Number of threads used to run tasks concurrently when gevent is not patching the process
+THREAD_POOL_SIZE = config("THREAD_POOL_SIZE", default=32, cast=int)
+
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=THREAD_POOL_SIZE)
+
+
+# Under the gunicorn gevent worker, sockets are patched and greenlets are the cheapest way to wait on I/O
+def is_gevent_patched():
+    return gevent is not None and monkey.is_module_patched("socket")
+
+
+# A function running in the background, in a greenlet or in a thread of executor,
+# the shared one by default
+class Task:
+    def __init__(self, function, *args, executor=None):
+        if is_gevent_patched():
+            self._greenlet = gevent.spawn(function, *args)
+            self._future = None
+        else:
+            self._greenlet = None
+            self._future = (executor or _executor).submit(function, *args)
+
+    def ready(self):
+        if self._greenlet is not None:
+            return self._greenlet.ready()
+        return self._future.done()
+
+    # Waits for the function to return and returns its result
+    # Raises TimeoutError if it doesn't finish within timeout seconds
+    def get(self, timeout=None):
+        if self._greenlet is not None:
+            try:
+                return self._greenlet.get(timeout=timeout)
+            except gevent.Timeout:
+                raise TimeoutError()
+
+        try:
+            return self._future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            raise TimeoutError()
+
+
+def spawn(function, *args):
+    return Task(function, *args)
+
+
+# Like spawn, but without gevent the function gets a thread of its own instead of one of the shared executor
+# For functions that wait for tasks of the shared executor: if they took all of its threads,
+# those tasks would never run
+def spawn_dedicated(function, *args):
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    try:
+        return Task(function, *args, executor=executor)
+    finally:
+        # The thread ends with the function
+        executor.shutdown(wait=False)
+
+
+# Runs the functions concurrently and returns their results in the same order
+def run_concurrently(*functions):
+    tasks = [spawn(function) for function in functions]
+    return [task.get() for task in tasks]
+
+
+# Runs function for each item, at most limit at a time, and returns the results in the same order
+def map_concurrently(function, items, limit):
+    if is_gevent_patched():
+        return gevent.pool.Pool(limit).map(function, items)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=limit) as executor:
+        return list(executor.map(function, items))
@@ -0,0 +1,136 @@
+import dns.name
+import dns.rdatatype
+import dns.resolver
+from decouple import config
+
+from .cache import TTLCache
+
+# Maximum number of DNS answers kept in memory
+DNS_CACHE_MAX_SIZE = config("DNS_CACHE_MAX_SIZE", default=10000, cast=int)
+
+# Upper bound for how long an answer is kept, regardless of the record TTL
+DNS_CACHE_MAX_TTL = config("DNS_CACHE_MAX_TTL", default=3600, cast=int)
+
+# Maximum number of negative answers (NXDOMAIN, NoAnswer, NoNameservers) kept in memory
+DNS_NEGATIVE_CACHE_MAX_SIZE = config(
+    "DNS_NEGATIVE_CACHE_MAX_SIZE", default=10000, cast=int
+)
+
+# How long a negative answer is kept when the response has no SOA record to derive it from
+DNS_NEGATIVE_CACHE_TTL = config("DNS_NEGATIVE_CACHE_TTL", default=300, cast=int)
+
+# Upper bound for how long a negative answer is kept, regardless of the SOA minimum
+DNS_NEGATIVE_CACHE_MAX_TTL = config(
+    "DNS_NEGATIVE_CACHE_MAX_TTL", default=3600, cast=int
+)
+
+# Errors that mean the name or the record does not exist, as opposed to transient failures like timeouts
+NEGATIVE_ERRORS = (
+    dns.resolver.NXDOMAIN,
+    dns.resolver.NoAnswer,
+    dns.resolver.NoNameservers,
+)
+
+
+# Caches DNS answers in process, honouring the TTL of the records
+class DNSCache:
+    def __init__(
+        self,
+        max_size=DNS_CACHE_MAX_SIZE,
+        max_ttl=DNS_CACHE_MAX_TTL,
+        negative_max_size=DNS_NEGATIVE_CACHE_MAX_SIZE,
+        negative_ttl=DNS_NEGATIVE_CACHE_TTL,
+        negative_max_ttl=DNS_NEGATIVE_CACHE_MAX_TTL,
+    ):
+        self.max_ttl = max_ttl
+        self.answers = TTLCache(max_size)
+
+        # Negative answers are kept apart so that dead domains don't evict live ones
+        self.negative_ttl = negative_ttl
+        self.negative_max_ttl = negative_max_ttl
+        self.negative_answers = TTLCache(negative_max_size)
+
+    @staticmethod
+    def make_key(qname, rdtype):
+        return (str(qname).lower().rstrip("."), str(rdtype).upper())
+
+    # A new error of the cached type for each lookup served from the negative cache,
+    # so that callers don't share one error and its traceback
+    @staticmethod
+    def make_negative_error(error_type, qname):
+        if error_type is dns.resolver.NXDOMAIN:
+            return error_type(qnames=[dns.name.from_text(str(qname))])
+        return error_type()
+
+    # How long a negative answer can be cached, based on RFC 2308:
+    # the smaller of the SOA record TTL and its minimum field
+    def get_negative_ttl(self, error):
+        try:
+            if isinstance(error, dns.resolver.NXDOMAIN):
+                responses = list(error.responses().values())
+            elif isinstance(error, dns.resolver.NoAnswer):
+                responses = [error.response()]
+            else:
+                responses = []
+        except KeyError:
+            # The exception was raised without the responses attached
+            responses = []
+
+        ttls = [
+            min(rrset.ttl, rrset[0].minimum)
+            for response in responses
+            for rrset in response.authority
+            if rrset.rdtype == dns.rdatatype.SOA
+        ]
+
+        ttl = min(ttls) if ttls else self.negative_ttl
+        return min(ttl, self.negative_max_ttl)
+
+    # Same as dns.resolver.resolve, but answers are served from the cache while their TTL lasts
+    def resolve(self, qname, rdtype):
+        key = DNSCache.make_key(qname, rdtype)
+
+        # A name that doesn't exist doesn't exist for any record type
+        nxdomain_key = DNSCache.make_key(qname, "ANY")
+
+        answer = self.answers.get(key)
+        if answer is not None:
+            return answer
+
+        error_type = self.negative_answers.get(nxdomain_key)
+        if error_type is None:
+            error_type = self.negative_answers.get(key)
+        if error_type is not None:
+            raise DNSCache.make_negative_error(error_type, qname)
+
+        try:
+            answer = dns.resolver.resolve(qname, rdtype)
+        except NEGATIVE_ERRORS as e:
+            # Only the type of the error is kept, the error itself holds the frames of its caller
+            self.negative_answers.set(
+                nxdomain_key if isinstance(e, dns.resolver.NXDOMAIN) else key,
+                type(e),
+                self.get_negative_ttl(e),
+            )
+            raise
+
+        self.answers.set(key, answer, min(answer.rrset.ttl, self.max_ttl))
+        return answer
+
+    def clear(self):
+        self.answers.clear()
+        self.negative_answers.clear()
+
+    def stats(self):
+        return {
+            "answers": self.answers.stats(),
+            "negative_answers": self.negative_answers.stats(),
+        }
+
+
+# Shared by all lookups in this process
+dns_cache = DNSCache()
+
+
+def resolve(qname, rdtype):
+    return dns_cache.resolve(qname, rdtype)
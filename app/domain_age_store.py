@@ -0,0 +1,87 @@
+import datetime
+import sqlite3
+
+from decouple import config
+
+# SQLite file shared by the workers of this deployment
+DOMAIN_AGE_STORE_PATH = config("DOMAIN_AGE_STORE_PATH", default="domain_ages.sqlite3")
+
+# How long we keep that whois didn't report a creation date for a domain, in seconds
+# This can come from a rate limited whois server or an output format we don't parse, so it is retried
+DOMAIN_AGE_MISSING_TTL = config("DOMAIN_AGE_MISSING_TTL", default=86400, cast=int)
+
+
+# Persistent map of registrable domain to its creation date
+# A domain's creation date doesn't change, so whois only needs to run once per domain
+class DomainAgeStore:
+    def __init__(self, path=DOMAIN_AGE_STORE_PATH, missing_ttl=DOMAIN_AGE_MISSING_TTL):
+        self.path = path
+        self.missing_ttl = missing_ttl
+        self._initialized = False
+
+    def connect(self):
+        # A connection per call keeps this safe across threads, greenlets and processes
+        connection = sqlite3.connect(self.path, timeout=5)
+
+        if not self._initialized:
+            # WAL lets the other workers read while one of them writes
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS domain_ages ("
+                "domain TEXT PRIMARY KEY, "
+                "creation_date TEXT, "
+                "checked_at TEXT NOT NULL)"
+            )
+            connection.commit()
+            self._initialized = True
+
+        return connection
+
+    # Returns (is_stored, creation_date)
+    # creation_date is None for domains whose whois output didn't have one,
+    # those are only kept for missing_ttl seconds
+    def get(self, domain):
+        try:
+            connection = self.connect()
+            try:
+                row = connection.execute(
+                    "SELECT creation_date, checked_at FROM domain_ages WHERE domain = ?",
+                    (domain.lower(),),
+                ).fetchone()
+            finally:
+                connection.close()
+        except sqlite3.Error:
+            # If the store is not usable, we behave as if the domain wasn't stored
+            return False, None
+
+        if row is None:
+            return False, None
+
+        creation_date, checked_at = row
+        if creation_date is None:
+            checked_at = datetime.datetime.fromisoformat(checked_at)
+            age = datetime.datetime.now(datetime.timezone.utc) - checked_at
+            return age.total_seconds() < self.missing_ttl, None
+
+        return True, datetime.datetime.fromisoformat(creation_date)
+
+    def set(self, domain, creation_date):
+        try:
+            connection = self.connect()
+            try:
+                with connection:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO domain_ages VALUES (?, ?, ?)",
+                        (
+                            domain.lower(),
+                            creation_date.isoformat() if creation_date else None,
+                            datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                        ),
+                    )
+            finally:
+                connection.close()
+        except sqlite3.Error:
+            pass
+
+
+domain_age_store = DomainAgeStore()
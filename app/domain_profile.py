@@ -0,0 +1,93 @@
+from decouple import config
+
+from .cache import TTLCache
+
+# Maximum number of domain profiles kept in memory
+DOMAIN_PROFILE_CACHE_MAX_SIZE = config(
+    "DOMAIN_PROFILE_CACHE_MAX_SIZE", default=10000, cast=int
+)
+
+# How long a domain profile is reused
+DOMAIN_PROFILE_CACHE_TTL = config("DOMAIN_PROFILE_CACHE_TTL", default=3600, cast=int)
+
+# How long a domain profile is reused when the domain alone decided the verdict (no name servers, no MX)
+# This is shorter because a domain may be in the middle of being set up
+# Profiles whose DNS lookups failed, e.g. timed out, are not reused at all
+DOMAIN_PROFILE_CACHE_NEGATIVE_TTL = config(
+    "DOMAIN_PROFILE_CACHE_NEGATIVE_TTL", default=300, cast=int
+)
+
+# Maximum number of catch-all verdicts kept in memory
+CATCH_ALL_CACHE_MAX_SIZE = config("CATCH_ALL_CACHE_MAX_SIZE", default=10000, cast=int)
+
+# How long a catch-all verdict is reused
+CATCH_ALL_CACHE_TTL = config("CATCH_ALL_CACHE_TTL", default=21600, cast=int)
+
+# Attributes of Email that only depend on the domain
+DOMAIN_FIELDS = (
+    "subdomain",
+    "domain",
+    "tld",
+    "domain_age",
+    "is_free_provider",
+    "smtp_provider_host",
+    "smtp_provider_host_domain",
+    "smtp_provider_host_tld",
+    "smtp_provider_ip",
+    "smtp_provider_ip_ptr",
+    "has_mx_records",
+    "is_disposable",
+    "autodiscover_host",
+    "autodiscover_domain",
+    "autodiscover_host_tld",
+    "email_security_gateway",
+    "email_provider",
+)
+
+
+# Everything we found out about a domain, shared by all emails on that domain
+class DomainProfile:
+    def __init__(self, fqdn, facts, status="", status_detail="", is_transient=False):
+        self.fqdn = fqdn
+
+        # Values of DOMAIN_FIELDS
+        self.facts = facts
+
+        # Verdict, if the domain alone is enough to decide it (e.g. it has no MX records)
+        self.status = status
+        self.status_detail = status_detail
+
+        # Whether the verdict comes from a failure that may not happen again, e.g. a DNS timeout
+        self.is_transient = is_transient
+
+        # Background lookup of the domain age, until its result is filled in the facts
+        self.domain_age_task = None
+
+    # Takes the domain level results from an email that went through the domain checks
+    @classmethod
+    def from_email(cls, email, status="", status_detail="", is_transient=False):
+        facts = {field: getattr(email, field) for field in DOMAIN_FIELDS}
+        profile = cls(email.fqdn, facts, status, status_detail, is_transient)
+        profile.domain_age_task = email._domain_age_task
+        return profile
+
+    # Copies the domain level results to another email on the same domain
+    def apply_to(self, email):
+        for field, value in self.facts.items():
+            setattr(email, field, value)
+        email._domain_age_task = self.domain_age_task
+
+    def ttl(self):
+        if self.is_transient:
+            return 0
+        if self.status:
+            return DOMAIN_PROFILE_CACHE_NEGATIVE_TTL
+        return DOMAIN_PROFILE_CACHE_TTL
+
+
+# Shared by all emails in this process, keyed by the lowercase FQDN
+domain_profiles = TTLCache(DOMAIN_PROFILE_CACHE_MAX_SIZE)
+
+# Whether the mail server of the domain accepts every address, keyed by the lowercase FQDN
+# Kept apart from the profiles because it is only known after an SMTP session and has its own TTL
+catch_all_verdicts = TTLCache(CATCH_ALL_CACHE_MAX_SIZE, CATCH_ALL_CACHE_TTL)
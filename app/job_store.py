@@ -0,0 +1,139 @@
+import json
+import sqlite3
+
+from decouple import config
+
+# SQLite file shared by the workers of this deployment, so that any worker can answer polls of a job
+JOB_STORE_PATH = config("JOB_STORE_PATH", default="jobs.sqlite3")
+
+
+# Progress and results of the jobs of every worker
+# The worker running a job writes to it, the others read it when they are polled for that job
+class JobStore:
+    def __init__(self, path=JOB_STORE_PATH):
+        self.path = path
+        self._initialized = False
+
+    def connect(self):
+        # A connection per call keeps this safe across threads, greenlets and processes
+        connection = sqlite3.connect(self.path, timeout=5)
+
+        if not self._initialized:
+            # WAL lets the other workers read while one of them writes
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, "
+                "status TEXT NOT NULL, "
+                "total INTEGER NOT NULL, "
+                "deferred INTEGER NOT NULL, "
+                "options TEXT NOT NULL, "
+                "finished_at REAL)"
+            )
+            # Results are read back in the order they were added, by rowid
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS job_results ("
+                "job_id TEXT NOT NULL, "
+                "email_index INTEGER NOT NULL, "
+                "result TEXT NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS job_results_job_id "
+                "ON job_results (job_id)"
+            )
+            connection.commit()
+            self._initialized = True
+
+        return connection
+
+    # Runs a statement in a transaction, errors are ignored as the worker running the job
+    # still answers its own polls
+    def write(self, statement, parameters):
+        try:
+            connection = self.connect()
+            try:
+                with connection:
+                    connection.execute(statement, parameters)
+            finally:
+                connection.close()
+        except sqlite3.Error:
+            pass
+
+    # Stores the status of a job, created when it is first saved
+    def save(self, job):
+        self.write(
+            "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                job.id,
+                job.status,
+                len(job.emails),
+                job.deferred,
+                json.dumps(job.options),
+                job.finished_at,
+            ),
+        )
+
+    def add_result(self, job_id, item):
+        index, result = item
+        self.write(
+            "INSERT INTO job_results VALUES (?, ?, ?)",
+            (job_id, index, json.dumps(result, default=str)),
+        )
+
+    # The same as Job.snapshot, None if the job isn't stored
+    def snapshot(self, job_id, since=0):
+        try:
+            connection = self.connect()
+            try:
+                job = connection.execute(
+                    "SELECT status, total, deferred, options FROM jobs WHERE id = ?",
+                    (job_id,),
+                ).fetchone()
+                if job is None:
+                    return None
+
+                (completed,) = connection.execute(
+                    "SELECT COUNT(*) FROM job_results WHERE job_id = ?", (job_id,)
+                ).fetchone()
+                results = connection.execute(
+                    "SELECT email_index, result FROM job_results WHERE job_id = ? "
+                    "ORDER BY rowid LIMIT -1 OFFSET ?",
+                    (job_id, since),
+                ).fetchall()
+            finally:
+                connection.close()
+        except sqlite3.Error:
+            return None
+
+        status, total, deferred, options = job
+        return {
+            "id": job_id,
+            "status": status,
+            "total": total,
+            "completed": completed,
+            "deferred": deferred,
+            "options": json.loads(options),
+            "results": [(index, json.loads(result)) for index, result in results],
+        }
+
+    # Forgets the jobs that finished before the given time
+    def remove_expired(self, expired_before):
+        try:
+            connection = self.connect()
+            try:
+                with connection:
+                    connection.execute(
+                        "DELETE FROM job_results WHERE job_id IN "
+                        "(SELECT id FROM jobs WHERE finished_at < ?)",
+                        (expired_before,),
+                    )
+                    connection.execute(
+                        "DELETE FROM jobs WHERE finished_at < ?", (expired_before,)
+                    )
+            finally:
+                connection.close()
+        except sqlite3.Error:
+            pass
+
+
+job_store = JobStore()
@@ -0,0 +1,293 @@
+import queue
+import threading
+import time
+import uuid
+
+from decouple import config
+
+from .batch import iter_batch_results
+from .job_store import job_store
+from .retry_scheduler import (
+    GREYLIST_MAX_RETRIES,
+    GREYLIST_RETRY_BATCH_WINDOW,
+    GREYLIST_RETRY_DELAY,
+    retry_scheduler,
+)
+
+# Maximum number of emails accepted in one job
+JOB_MAX_EMAILS = config("JOB_MAX_EMAILS", default=100000, cast=int)
+
+# Maximum number of jobs waiting for a worker, more are refused until some start
+JOB_QUEUE_SIZE = config("JOB_QUEUE_SIZE", default=20, cast=int)
+
+# Number of jobs worked on at the same time
+JOB_WORKERS = config("JOB_WORKERS", default=2, cast=int)
+
+# How long the results of a finished job are kept for polling, in seconds
+JOB_RESULT_TTL = config("JOB_RESULT_TTL", default=3600, cast=int)
+
+# Longest a poll request waits for new results, in seconds
+JOB_MAX_WAIT = config("JOB_MAX_WAIT", default=30, cast=float)
+
+# How often a poll of a job running on another worker reads the job store again, in seconds
+STORE_POLL_INTERVAL = 0.5
+
+
+# A list of emails validated in the background
+# Its progress and results are also written to store, if any, for the other workers
+class Job:
+    def __init__(self, emails, options=None, store=None):
+        self.id = uuid.uuid4().hex
+        self.emails = emails
+        self.store = store
+
+        # Request options kept for when the results are read, e.g. debug
+        self.options = options or {}
+
+        # queued, running, finished or failed
+        self.status = "queued"
+
+        # (index of the email, result) in the order they finished
+        self.results = []
+
+        # Number of emails deferred by their mail server, waiting to be checked again
+        self.deferred = 0
+
+        # Whether every email was checked once
+        self.is_checked = False
+
+        self.created_at = time.time()
+        self.finished_at = None
+
+        # Notified when a result is added or the job ends
+        self._changed = threading.Condition()
+
+    def is_done(self):
+        return self.status in ("finished", "failed")
+
+    # Writes the status of the job to the store
+    def save(self):
+        if self.store is not None:
+            self.store.save(self)
+
+    def add_result(self, item):
+        with self._changed:
+            self.results.append(item)
+            if self.store is not None:
+                self.store.add_result(self.id, item)
+            self._changed.notify_all()
+
+    def defer(self):
+        with self._changed:
+            self.deferred += 1
+            self.save()
+
+    # Adds the result of a deferred email after its last retry
+    def add_retried_result(self, item):
+        with self._changed:
+            self.deferred -= 1
+            self.results.append(item)
+            if self.store is not None:
+                self.store.add_result(self.id, item)
+            self.finish_if_done()
+            self.save()
+            self._changed.notify_all()
+
+    # Called once every email was checked once, the job is finished unless some were deferred
+    def finish_checking(self):
+        with self._changed:
+            self.is_checked = True
+            self.finish_if_done()
+            self.save()
+            self._changed.notify_all()
+
+    def finish_if_done(self):
+        if self.is_checked and self.deferred == 0 and self.status == "running":
+            self.status = "finished"
+            self.finished_at = time.time()
+
+    def set_status(self, status):
+        with self._changed:
+            self.status = status
+            if self.is_done():
+                self.finished_at = time.time()
+            self.save()
+            self._changed.notify_all()
+
+    # Waits up to timeout seconds until there are more than `since` results or the job is done
+    def wait(self, since, timeout):
+        with self._changed:
+            self._changed.wait_for(
+                lambda: len(self.results) > since or self.is_done(), timeout
+            )
+
+    # Progress and the results that finished after the first `since` ones
+    def snapshot(self, since=0):
+        with self._changed:
+            return {
+                "id": self.id,
+                "status": self.status,
+                "total": len(self.emails),
+                "completed": len(self.results),
+                "deferred": self.deferred,
+                "options": self.options,
+                "results": self.results[since:],
+            }
+
+
+# A bounded queue of jobs and the workers that run them
+# The queue and the jobs it runs belong to one process, their progress and results are shared
+# with the other processes of the deployment through store
+class JobQueue:
+    def __init__(self, max_size=JOB_QUEUE_SIZE, workers=JOB_WORKERS, store=job_store):
+        self.workers = workers
+        self.store = store
+        self.pending = queue.Queue(maxsize=max_size)
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._started = False
+
+        # Deferred emails of all jobs waiting for the same retry, see park
+        self._retry_batch = None
+
+    # Queues the emails for validation and returns the job
+    # Raises queue.Full if too many jobs are waiting
+    def submit(self, emails, options=None):
+        self.start()
+        self.remove_expired()
+
+        job = Job(emails, options, self.store)
+        with self._lock:
+            self.jobs[job.id] = job
+
+        try:
+            self.pending.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self.jobs[job.id]
+            raise
+
+        job.save()
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    # Progress and the results that finished after the first `since` ones of a job of any worker,
+    # waiting up to `wait` seconds for new results
+    # None if the job isn't known
+    def snapshot(self, job_id, since=0, wait=0):
+        job = self.get(job_id)
+        if job is not None:
+            if wait:
+                job.wait(since, wait)
+            return job.snapshot(since)
+
+        # The job runs on another worker, we read its progress from the store
+        deadline = time.monotonic() + wait
+        while True:
+            snapshot = self.store.snapshot(job_id, since)
+            if (
+                snapshot is None
+                or snapshot["results"]
+                or snapshot["status"] in ("finished", "failed")
+                or time.monotonic() >= deadline
+            ):
+                return snapshot
+            time.sleep(min(STORE_POLL_INTERVAL, max(deadline - time.monotonic(), 0)))
+
+    # Forgets finished jobs whose results were kept long enough
+    def remove_expired(self):
+        expired_before = time.time() - JOB_RESULT_TTL
+        with self._lock:
+            for job_id, job in list(self.jobs.items()):
+                if job.is_done() and job.finished_at < expired_before:
+                    del self.jobs[job_id]
+        self.store.remove_expired(expired_before)
+
+    # Workers are started with the first job, under gevent these threads are greenlets
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+        for _ in range(self.workers):
+            threading.Thread(target=self.work, daemon=True).start()
+
+    def work(self):
+        while True:
+            self.run(self.pending.get())
+
+    # Checks every email of the job once
+    # Emails deferred by their mail server are parked and checked again later by retry,
+    # so the worker can move on to the next job meanwhile
+    def run(self, job):
+        job.set_status("running")
+        try:
+            for index, result in iter_batch_results(job.emails):
+                if result.get("is_greylisted") and GREYLIST_MAX_RETRIES > 0:
+                    job.defer()
+                    self.park(job, index, 1, result)
+                else:
+                    job.add_result((index, result))
+        except Exception as e:
+            job.set_status("failed")
+        else:
+            job.finish_checking()
+
+    # Parks a deferred email of job until its retry, result is the one of its last check
+    # The emails deferred within GREYLIST_RETRY_BATCH_WINDOW seconds of each other share a retry,
+    # so that those of the same mail server are checked again together, in the same sessions
+    def park(self, job, index, attempt, result):
+        due_at = time.monotonic() + GREYLIST_RETRY_DELAY
+        with self._lock:
+            batch = self._retry_batch
+            if batch is None or batch["due_at"] < due_at:
+                batch = self._retry_batch = {
+                    "due_at": due_at + GREYLIST_RETRY_BATCH_WINDOW,
+                    "emails": [],
+                }
+                retry_scheduler.schedule(
+                    GREYLIST_RETRY_DELAY + GREYLIST_RETRY_BATCH_WINDOW,
+                    self.retry,
+                    batch,
+                )
+            batch["emails"].append((job, index, attempt, result))
+
+    # Checks a batch of deferred emails again, grouped by mail server like the first check
+    # Each email is deferred again until it gets a verdict or runs out of retries
+    def retry(self, batch):
+        # Emails deferred from now on go to the next batch
+        with self._lock:
+            if self._retry_batch is batch:
+                self._retry_batch = None
+        emails = batch["emails"]
+
+        results = [result for _, _, _, result in emails]
+        try:
+            for position, result in iter_batch_results(
+                [job.emails[index] for job, index, _, _ in emails]
+            ):
+                results[position] = result
+        except Exception as e:
+            # The emails not checked again keep the result of their previous check
+            pass
+
+        for (job, index, attempt, _), result in zip(emails, results):
+            if result.get("is_greylisted") and attempt < GREYLIST_MAX_RETRIES:
+                self.park(job, index, attempt + 1, result)
+            else:
+                job.add_retried_result((index, result))
+
+    def stats(self):
+        with self._lock:
+            statuses = [job.status for job in self.jobs.values()]
+        return {
+            status: statuses.count(status)
+            for status in ("queued", "running", "finished", "failed")
+        }
+
+
+job_queue = JobQueue()
@@ -697,6 +697,9 @@ role_email_accounts = [
     "zentrale",
 ]
 
+# The same accounts as a set, for membership tests
+role_email_accounts_index = frozenset(role_email_accounts)
+
 free_email_domains = [
     "0-mail.com",
     "027168.com",
@@ -5470,8 +5473,14 @@ free_email_domains = [
     "zzz.pl",
 ]
 
+# The same domains as a set, for membership tests
+free_email_domains_index = frozenset(free_email_domains)
+
 disposable_smtp_provider_ips = ["15.204.213.223", "24.199.65.248"]
 
+# The same addresses as a set, for membership tests
+disposable_smtp_provider_ips_index = frozenset(disposable_smtp_provider_ips)
+
 email_security_gateway_map = {
     "iphmx": "cisco ironport",
     "mimecast": "mimecast",
@@ -5581,3 +5590,39 @@ blacklist_messages = [
     "relay not permitted",
     "not yet authorized",
 ]
+
+# Replies whose codes alone tell what they mean, by (stage, reply code, enhanced status code)
+# The verdicts are the names of the phrase lists above, an empty reply code matches any code
+# of the same class as the enhanced status code
+# Replies that aren't in here, e.g. 550 5.7.1 which servers use for anything, are classified by their phrases
+smtp_reply_verdicts = {
+    # Bad destination mailbox address
+    ("rcpt", "", "5.1.1"): "invalid_email",
+    # Destination mailbox has moved, no forwarding address
+    ("rcpt", "", "5.1.6"): "invalid_email",
+    # The domain doesn't accept email, null MX
+    ("rcpt", "", "5.1.10"): "invalid_email",
+    # Mailbox disabled, not accepting messages
+    ("rcpt", "", "5.2.1"): "account_disabled",
+    # Mailbox full
+    ("rcpt", "", "5.2.2"): "mailbox_full",
+    ("rcpt", "", "4.2.2"): "mailbox_full",
+    ("rcpt", "552", ""): "mailbox_full",
+    # Microsoft blocks the IP address we connect from
+    ("rcpt", "", "5.7.606"): "blacklist",
+    ("rcpt", "", "5.7.511"): "blacklist",
+    # The mail server refuses to talk to us
+    ("banner", "554", ""): "blacklist",
+    ("banner", "", "5.7.1"): "blacklist",
+    ("helo", "", "5.7.1"): "blacklist",
+    ("mail", "", "5.7.1"): "blacklist",
+}
+
+# The stages whose replies can contain the phrases of each list
+# Only the RCPT TO reply is about the address, while refusing the banner, EHLO or MAIL FROM is about us
+smtp_phrase_stages = {
+    "account_disabled": {"rcpt"},
+    "mailbox_full": {"rcpt"},
+    "invalid_email": {"rcpt"},
+    "blacklist": {"banner", "helo", "mail", "rcpt"},
+}
@@ -0,0 +1,87 @@
+import re
+from collections import deque
+
+from .knowledge_base import (
+    account_disabled_messages,
+    blacklist_messages,
+    invalid_email_messages,
+    mailbox_full_messages,
+)
+
+
+# Finds which phrases of several lists a text contains, in a single pass over the text
+# The phrases are compiled into an Aho-Corasick automaton: each character moves from one state
+# to the next with a dict lookup, and each state knows the phrases that end there
+class PhraseMatcher:
+    # phrase_lists maps a name to a list of phrases, matched case-insensitively
+    def __init__(self, phrase_lists):
+        self.phrase_lists = phrase_lists
+
+        # Trie of the lowercased phrases, state 0 is the root
+        transitions = [{}]
+        outputs = [[]]
+        for name, phrases in phrase_lists.items():
+            for index, phrase in enumerate(phrases):
+                state = 0
+                for char in phrase.lower():
+                    if char not in transitions[state]:
+                        transitions.append({})
+                        outputs.append([])
+                        transitions[state][char] = len(transitions) - 1
+                    state = transitions[state][char]
+                outputs[state].append((name, index, phrase))
+
+        # Breadth first, each state falls back to the longest suffix of its text that is also in the trie,
+        # and inherits the transitions and phrases of that state
+        fallbacks = [0] * len(transitions)
+        queue = deque(transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            fallback = fallbacks[state]
+            outputs[state] = outputs[state] + outputs[fallback]
+
+            for char, next_state in transitions[state].items():
+                if state != 0:
+                    fallbacks[next_state] = transitions[fallback].get(char, 0)
+                queue.append(next_state)
+
+            if state != 0:
+                transitions[state] = {**transitions[fallback], **transitions[state]}
+
+        self.transitions = transitions
+        self.outputs = outputs
+
+    # Returns {name: [phrases of that list found in text]} for the lists with at least one phrase found
+    # The phrases are in the order of their list, text is expected to be lowercase
+    def scan(self, text):
+        transitions, outputs = self.transitions, self.outputs
+
+        found = {}
+        state = 0
+        for char in text:
+            state = transitions[state].get(char, 0)
+            if outputs[state]:
+                for name, index, phrase in outputs[state]:
+                    found.setdefault(name, {})[index] = phrase
+
+        return {
+            name: [phrase for _, phrase in sorted(phrases.items())]
+            for name, phrases in found.items()
+        }
+
+
+# The phrase lists we look for in SMTP response messages, compiled once
+smtp_message_phrases = PhraseMatcher(
+    {
+        "account_disabled": account_disabled_messages,
+        "mailbox_full": mailbox_full_messages,
+        "invalid_email": invalid_email_messages,
+        "blacklist": blacklist_messages,
+    }
+)
+
+
+# Removes the <addresses> from an SMTP response message,
+# so that phrases in the address being tested don't match our phrases
+def strip_addresses(message):
+    return re.sub(r"<[^>]*>", "", message)
@@ -0,0 +1,63 @@
+import heapq
+import itertools
+import threading
+import time
+
+from decouple import config
+
+# Seconds we wait before checking again an email whose mail server deferred it, e.g. greylisting
+# Greylisting servers usually accept a retry after one to five minutes
+GREYLIST_RETRY_DELAY = config("GREYLIST_RETRY_DELAY", default=300, cast=float)
+
+# Number of times a deferred email is checked again before its last result is reported
+GREYLIST_MAX_RETRIES = config("GREYLIST_MAX_RETRIES", default=2, cast=int)
+
+# Deferred emails coming due within this many seconds of the first one are checked again together,
+# grouped by mail server, so a retry may come this much later than GREYLIST_RETRY_DELAY
+GREYLIST_RETRY_BATCH_WINDOW = config(
+    "GREYLIST_RETRY_BATCH_WINDOW", default=30, cast=float
+)
+
+
+# Runs functions after a delay
+# Nothing waits while they are parked: one thread sleeps until the next one is due
+# and starts it on a thread of its own, under gevent a greenlet
+# Not on the shared executor of concurrency: the functions wait for tasks of that executor,
+# and could take all of its threads
+class RetryScheduler:
+    def __init__(self):
+        # (due time, sequence, function, args), the sequence keeps the heap from comparing functions
+        self.heap = []
+        self._sequence = itertools.count()
+        self._changed = threading.Condition()
+        self._started = False
+
+    # Runs function(*args) in the background after delay seconds
+    def schedule(self, delay, function, *args):
+        with self._changed:
+            heapq.heappush(
+                self.heap,
+                (time.monotonic() + delay, next(self._sequence), function, args),
+            )
+            self._changed.notify()
+
+            if not self._started:
+                self._started = True
+                threading.Thread(target=self.work, daemon=True).start()
+
+    def work(self):
+        while True:
+            with self._changed:
+                while not self.heap or self.heap[0][0] > time.monotonic():
+                    timeout = self.heap[0][0] - time.monotonic() if self.heap else None
+                    self._changed.wait(timeout)
+                _, _, function, args = heapq.heappop(self.heap)
+
+            threading.Thread(target=function, args=args, daemon=True).start()
+
+    def stats(self):
+        with self._changed:
+            return {"scheduled": len(self.heap)}
+
+
+retry_scheduler = RetryScheduler()
@@ -0,0 +1,40 @@
+from .knowledge_base import role_email_accounts
+
+# Characters that separate the words of an account, they are all treated as "."
+SEPARATORS = str.maketrans("-_", "..")
+
+# Key of the trie node where an entry ends, no character of an account is empty
+END = ""
+
+
+# Tells whether an account is a role account like info, sales-team or all.staff
+# The entries are kept in a trie of characters, so a check takes one step per character
+# of the account however long the list is
+# An entry matches the whole account, or its first words when a separator follows,
+# and entries ending with a separator like all- match any account starting with them
+class RoleAccounts:
+    def __init__(self, accounts):
+        self.trie = {}
+        for account in accounts:
+            node = self.trie
+            for char in account.lower().translate(SEPARATORS):
+                node = node.setdefault(char, {})
+            node[END] = True
+
+    def __contains__(self, account):
+        account = account.lower().translate(SEPARATORS)
+
+        node = self.trie
+        for position, char in enumerate(account):
+            # An entry ended at a separator, either its own or the account's next one
+            if END in node and (char == "." or account[position - 1] == "."):
+                return True
+
+            node = node.get(char)
+            if node is None:
+                return False
+
+        return END in node
+
+
+role_accounts = RoleAccounts(role_email_accounts)
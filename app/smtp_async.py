@@ -0,0 +1,253 @@
+import asyncio
+import threading
+import time
+
+from decouple import config
+
+from . import smtp_probe
+from .smtp_throttle import smtp_throttles
+from .smtp_probe import (
+    HELO_HOSTNAME,
+    SMTP_MAX_REPLY_SIZE,
+    SMTPSessionResult,
+    is_last_line,
+    parse_extensions,
+    parse_smtp_response,
+    transaction,
+)
+
+# Maximum number of SMTP sessions the asyncio engine runs at the same time, others wait for a slot
+SMTP_ASYNC_MAX_SESSIONS = config("SMTP_ASYNC_MAX_SESSIONS", default=1000, cast=int)
+
+
+# Reads the next whole reply from an asyncio stream, lines included
+# Raises ConnectionError if the connection closes before the reply is complete
+async def read_reply(reader):
+    lines = []
+    size = 0
+    while True:
+        line = await reader.readline()
+        if not line.endswith(b"\n"):
+            raise ConnectionError("Connection closed by the mail server")
+
+        lines.append(line)
+        size += len(line)
+        if size > SMTP_MAX_REPLY_SIZE:
+            raise ValueError("SMTP reply is too long")
+
+        if is_last_line(line):
+            return b"".join(lines).decode(errors="replace")
+
+
+# A conversation with a mail server over asyncio streams, one reply per command
+class AsyncSMTPSession:
+    def __init__(self, host, port=None):
+        self.host = host
+        self.port = smtp_probe.SMTP_PORT if port is None else port
+        self.reader = None
+        self.writer = None
+
+        # Replies to the banner and EHLO or HELO
+        self.greeting = []
+
+        # Extensions advertised in the reply to EHLO
+        self.extensions = set()
+
+        # Time by which the check must be done, None if only the read timeout applies
+        self.deadline = None
+
+    # Seconds we can wait for the next reply
+    # Raises TimeoutError if the deadline of the check has passed
+    def timeout(self, limit=None):
+        if limit is None:
+            limit = smtp_probe.SMTP_READ_TIMEOUT
+        if self.deadline is None:
+            return limit
+
+        time_left = self.deadline - time.monotonic()
+        if time_left <= 0:
+            raise TimeoutError("SMTP session timed out")
+        return min(limit, time_left)
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port),
+            self.timeout(smtp_probe.SMTP_CONNECT_TIMEOUT),
+        )
+
+        # Receive the greeting banner
+        return parse_smtp_response(
+            await asyncio.wait_for(read_reply(self.reader), self.timeout())
+        )
+
+    # Connects and introduces ourselves, the replies are added to greeting as they arrive
+    # EHLO tells us the extensions of the server, HELO is the fallback for servers without ESMTP
+    async def open(self):
+        self.greeting.append(await self.connect())
+
+        reply = (await self.exchange([f"EHLO {HELO_HOSTNAME}"]))[0]
+        response = parse_smtp_response(reply)
+        if response["code"] == "250":
+            self.extensions = parse_extensions(reply)
+        elif response["code"].startswith("5"):
+            response = await self.command(f"HELO {HELO_HOSTNAME}")
+        self.greeting.append(response)
+
+    def is_pipelining(self):
+        return smtp_probe.SMTP_PIPELINING and "PIPELINING" in self.extensions
+
+    # Sends SMTP commands in one write and returns their whole replies, in the same order
+    async def exchange(self, commands):
+        self.writer.write("".join(f"{command}\r\n" for command in commands).encode())
+        await asyncio.wait_for(self.writer.drain(), self.timeout())
+        return [
+            await asyncio.wait_for(read_reply(self.reader), self.timeout())
+            for _ in commands
+        ]
+
+    # Sends SMTP commands in one write and returns the parsed responses
+    async def commands(self, commands):
+        return [parse_smtp_response(reply) for reply in await self.exchange(commands)]
+
+    # Sends an SMTP command and returns the parsed response
+    async def command(self, command):
+        return (await self.commands([command]))[0]
+
+    # Ends the session politely and returns the reply to QUIT if we wait for it, None otherwise
+    async def quit(self, wait_for_reply=False):
+        try:
+            if wait_for_reply:
+                return await self.command("QUIT")
+            self.writer.write(b"QUIT\r\n")
+        except Exception:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+# Runs a transaction of smtp_probe, send(commands) is a coroutine returning the parsed replies
+async def run_transaction(conversation, send):
+    try:
+        commands = next(conversation)
+        while True:
+            commands = conversation.send(await send(commands))
+    except StopIteration as stop:
+        return stop.value
+
+
+# The asyncio version of smtp_probe.check_recipients, the session is always ended with QUIT
+async def check_recipients_async(
+    host, recipients, port=None, timeout=None, wait_for_quit=False, provider=None
+):
+    result = SMTPSessionResult(address for address, _ in recipients)
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    try:
+        await smtp_throttles.acquire_async(host, provider, deadline)
+    except TimeoutError:
+        # We didn't get to talk to the server in time
+        result.is_throttle_timeout = True
+        return result
+
+    try:
+        await run_session(host, port, recipients, result, deadline, wait_for_quit)
+    finally:
+        smtp_throttles.release(host, provider, result)
+
+    return result
+
+
+# Runs the check of check_recipients_async in a session and stores the replies in result
+async def run_session(host, port, recipients, result, deadline, wait_for_quit):
+    session = AsyncSMTPSession(host, port)
+    session.deadline = deadline
+    is_finished = False
+
+    try:
+        try:
+            await session.open()
+        finally:
+            result.greeting.extend(session.greeting)
+
+        await run_transaction(
+            transaction(result, recipients, session.is_pipelining()), session.commands
+        )
+        is_finished = True
+
+    except Exception:
+        # We report what we got until the failure
+        pass
+
+    finally:
+        if is_finished:
+            result.quit = await session.quit(wait_for_quit)
+        else:
+            session.close()
+
+
+# Runs the asyncio SMTP sessions on an event loop in a background thread
+# The synchronous check_recipients lets the rest of the app use it like the socket engine,
+# each caller only waits for its own session while the loop runs all of them
+class AsyncSMTPEngine:
+    def __init__(self, max_sessions=SMTP_ASYNC_MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self.loop = None
+        self._slots = None
+        self._lock = threading.Lock()
+
+    # Starts the event loop with the first session
+    def start(self):
+        with self._lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        return self.loop
+
+    # Runs a session on the event loop, waiting for a slot if max_sessions are running
+    # The timeout starts once the session has a slot
+    async def check(
+        self,
+        host,
+        recipients,
+        port=None,
+        timeout=None,
+        wait_for_quit=False,
+        provider=None,
+    ):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_sessions)
+
+        async with self._slots:
+            return await check_recipients_async(
+                host, recipients, port, timeout, wait_for_quit, provider
+            )
+
+    def check_recipients(
+        self,
+        host,
+        recipients,
+        port=None,
+        timeout=None,
+        wait_for_quit=False,
+        provider=None,
+    ):
+        return asyncio.run_coroutine_threadsafe(
+            self.check(host, recipients, port, timeout, wait_for_quit, provider),
+            self.start(),
+        ).result()
+
+    # Runs several sessions at once, checks is a list of (host, recipients, port[, timeout])
+    # Returns the SMTPSessionResults in the same order
+    def check_many(self, checks):
+        async def check_all():
+            return await asyncio.gather(*(self.check(*check) for check in checks))
+
+        return asyncio.run_coroutine_threadsafe(check_all(), self.start()).result()
+
+
+smtp_async_engine = AsyncSMTPEngine()
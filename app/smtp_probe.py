@@ -0,0 +1,589 @@
+import re
+import socket
+import threading
+import time
+
+from decouple import config
+
+from .smtp_throttle import smtp_throttles
+
+# Port of the mail servers we connect to
+SMTP_PORT = config("SMTP_PORT", default=25, cast=int)
+
+# Maximum number of RCPT TO commands sent in one session, including catch-all tests
+# RFC 5321 requires servers to accept at least 100, many throttle well before that
+SMTP_MAX_RECIPIENTS_PER_SESSION = config(
+    "SMTP_MAX_RECIPIENTS_PER_SESSION", default=20, cast=int
+)
+
+# How the SMTP conversations are run: "socket" for blocking sockets, cooperative under gevent,
+# or "asyncio" for an event loop running every session in one thread
+SMTP_ENGINE = config("SMTP_ENGINE", default="socket")
+
+# Whether sessions are kept open after a check and reused for the next checks on the same mail server
+# Only the socket engine pools its sessions
+SMTP_POOL_ENABLED = config("SMTP_POOL_ENABLED", default=True, cast=bool)
+
+# Maximum number of idle sessions kept open per mail server
+SMTP_POOL_MAX_IDLE_PER_HOST = config("SMTP_POOL_MAX_IDLE_PER_HOST", default=4, cast=int)
+
+# Maximum number of idle sessions kept open across all mail servers, the least recently used are closed first
+SMTP_POOL_MAX_IDLE = config("SMTP_POOL_MAX_IDLE", default=256, cast=int)
+
+# Idle sessions older than this, in seconds, are closed rather than reused
+# Mail servers usually drop idle clients after a few minutes, some after a few seconds
+SMTP_POOL_IDLE_TIMEOUT = config("SMTP_POOL_IDLE_TIMEOUT", default=30, cast=float)
+
+# Sessions are not reused after being open this long, in seconds
+SMTP_POOL_MAX_AGE = config("SMTP_POOL_MAX_AGE", default=300, cast=float)
+
+# Sessions are not reused after sending this many RCPT TO in total
+SMTP_POOL_MAX_RECIPIENTS = config("SMTP_POOL_MAX_RECIPIENTS", default=100, cast=int)
+
+# Seconds we wait for the mail server to accept the connection
+SMTP_CONNECT_TIMEOUT = config("SMTP_CONNECT_TIMEOUT", default=10, cast=float)
+
+# Seconds we wait for the reply to each command, or for the banner
+SMTP_READ_TIMEOUT = config("SMTP_READ_TIMEOUT", default=20, cast=float)
+
+# Seconds a whole check can take, from connecting to the last RCPT TO reply
+# Tarpitting servers answer each command slowly enough to stay within the read timeout
+SMTP_SESSION_TIMEOUT = config("SMTP_SESSION_TIMEOUT", default=45, cast=float)
+
+# Whether MAIL FROM and the RCPT TO commands are sent together to servers that advertise PIPELINING
+SMTP_PIPELINING = config("SMTP_PIPELINING", default=True, cast=bool)
+
+# Whether we wait for the reply to QUIT before closing the connection
+# It carries nothing we use, so by default QUIT is sent and the connection closed right away
+SMTP_WAIT_FOR_QUIT_REPLY = config("SMTP_WAIT_FOR_QUIT_REPLY", default=False, cast=bool)
+
+# Longest reply we read, in bytes, a server sending more isn't speaking SMTP
+SMTP_MAX_REPLY_SIZE = config("SMTP_MAX_REPLY_SIZE", default=65536, cast=int)
+
+# How we introduce ourselves to the mail servers
+HELO_HOSTNAME = "fancydomain.com"
+MAIL_FROM_ADDRESS = "test@fancydomain.com"
+
+# The stages of the replies a recipient sees, in the order of SMTPSessionResult.responses_for
+SMTP_STAGES = ("banner", "helo", "mail", "rcpt", "quit")
+
+
+# Enhanced status code at the start of a reply line, e.g. 5.1.1 or 5.7.606
+subcode_pattern = re.compile(r"[245]\.\d{1,3}\.\d{1,3}(?=\s|$)")
+
+
+# Parse the SMTP response, a whole reply of one or more lines
+def parse_smtp_response(response):
+    lines = response.splitlines() or [""]
+
+    # Parse the code
+    code = lines[0][:3]
+
+    # Parse the subcode, if it exists
+    match = subcode_pattern.match(lines[0], 4)
+    subcode = match.group() if match else ""
+
+    # Strip the code and subcode from each line and join the lines
+    texts = []
+    for line in lines:
+        text = line[4:].strip()
+        if subcode and text.startswith(subcode):
+            text = text[len(subcode) :].strip()
+        texts.append(text)
+    message = " ".join(text for text in texts if text)
+
+    result = {"code": code, "subcode": subcode, "message": message}
+    return result
+
+
+# The extension keywords a server advertises in its reply to EHLO, e.g. {"PIPELINING", "SIZE"}
+# The first line is the greeting of the server, each other line is an extension
+def parse_extensions(reply):
+    return {
+        line[4:].split(" ")[0].upper()
+        for line in reply.splitlines()[1:]
+        if line[4:].strip()
+    }
+
+
+# Whether a line is the last one of a reply: the code isn't followed by "-"
+def is_last_line(line):
+    return line[3:4] != b"-"
+
+
+# Reads whole SMTP replies from a socket, however the server's writes are split into packets
+# The lines of a reply are found in one buffer that is only trimmed once the reply is complete
+class ReplyReader:
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = bytearray()
+
+    # Returns the next reply, lines included
+    # Raises ConnectionError if the connection closes before the reply is complete,
+    # TimeoutError if the reply isn't complete within timeout seconds
+    def read_reply(self, timeout=None):
+        if timeout is None:
+            timeout = SMTP_READ_TIMEOUT
+        deadline = time.monotonic() + timeout
+        start = 0
+        while True:
+            end = self.buffer.find(b"\n", start)
+            if end == -1:
+                if len(self.buffer) > SMTP_MAX_REPLY_SIZE:
+                    raise ValueError("SMTP reply is too long")
+
+                time_left = deadline - time.monotonic()
+                if time_left <= 0:
+                    raise TimeoutError("SMTP reply timed out")
+                self.sock.settimeout(time_left)
+
+                chunk = self.sock.recv(4096)
+                if not chunk:
+                    raise ConnectionError("Connection closed by the mail server")
+                self.buffer += chunk
+                continue
+
+            is_last = is_last_line(self.buffer[start : start + 4])
+            start = end + 1
+            if is_last:
+                break
+
+        reply = self.buffer[:start].decode(errors="replace")
+        del self.buffer[:start]
+        return reply
+
+
+def is_accepted(response):
+    return response is not None and response["code"] in ("250", "251")
+
+
+# Whether the server deferred the recipient for now, as greylisting servers do with unknown senders
+# A later retry is likely to get a definitive reply
+def is_greylisted(response):
+    if response is None or not response["code"].startswith("4"):
+        return False
+    return (
+        response["code"] in ("450", "451")
+        or response["subcode"] == "4.7.1"
+        or any(word in response["message"].lower() for word in ("greylist", "graylist"))
+    )
+
+
+# Replies of one SMTP session where one or more recipients were checked
+class SMTPSessionResult:
+    def __init__(self, recipients):
+        # Replies to the banner, EHLO and MAIL FROM, shared by all recipients
+        self.greeting = []
+
+        # address -> reply to its RCPT TO
+        self.recipients = dict.fromkeys(recipients)
+
+        # catch-all test address -> reply to its RCPT TO
+        self.catch_all_tests = {}
+
+        # Reply to QUIT
+        self.quit = None
+
+        # Whether we gave up waiting for our turn with the mail server, see smtp_throttle
+        # The server wasn't contacted, a check later is likely to get through
+        self.is_throttle_timeout = False
+
+    # The replies of the session as seen by one recipient:
+    # banner, EHLO, MAIL FROM, its RCPT TO and QUIT, as far as the session got
+    # Each reply is annotated with its stage, one of SMTP_STAGES
+    def responses_for(self, recipient):
+        responses = list(self.greeting)
+        if len(responses) >= 3 and self.recipients.get(recipient) is not None:
+            responses.append(self.recipients[recipient])
+            if self.quit is not None:
+                responses.append(self.quit)
+
+        return [
+            dict(response, stage=stage)
+            for stage, response in zip(SMTP_STAGES, responses)
+        ]
+
+
+# A conversation with a mail server, one reply per command
+# Commands can be sent together when the server supports pipelining, the replies come in the same order
+class SMTPSession:
+    def __init__(self, host, port=None):
+        self.host = host
+        self.port = SMTP_PORT if port is None else port
+        self.sock = None
+        self.replies = None
+
+        # Replies to the banner and EHLO or HELO, kept for the checks that reuse the session
+        self.greeting = []
+
+        # Extensions advertised in the reply to EHLO
+        self.extensions = set()
+
+        self.opened_at = None
+        self.last_used_at = None
+
+        # Number of RCPT TO sent since the session was opened
+        self.recipients_sent = 0
+
+        # Time by which the current check must be done, None if only the read timeout applies
+        self.deadline = None
+
+    # Seconds we can wait for the next reply
+    # Raises TimeoutError if the deadline of the check has passed
+    def timeout(self, limit=None):
+        if limit is None:
+            limit = SMTP_READ_TIMEOUT
+        if self.deadline is None:
+            return limit
+
+        time_left = self.deadline - time.monotonic()
+        if time_left <= 0:
+            raise TimeoutError("SMTP session timed out")
+        return min(limit, time_left)
+
+    def connect(self):
+        self.sock = socket.create_connection(
+            (self.host, self.port), timeout=self.timeout(SMTP_CONNECT_TIMEOUT)
+        )
+        self.replies = ReplyReader(self.sock)
+        self.opened_at = self.last_used_at = time.monotonic()
+
+        # Receive the greeting banner
+        return parse_smtp_response(self.replies.read_reply(self.timeout()))
+
+    # Connects and introduces ourselves, the replies are added to greeting as they arrive
+    # EHLO tells us the extensions of the server, HELO is the fallback for servers without ESMTP
+    def open(self):
+        self.greeting.append(self.connect())
+
+        reply = self.exchange([f"EHLO {HELO_HOSTNAME}"])[0]
+        response = parse_smtp_response(reply)
+        if response["code"] == "250":
+            self.extensions = parse_extensions(reply)
+        elif response["code"].startswith("5"):
+            response = self.command(f"HELO {HELO_HOSTNAME}")
+        self.greeting.append(response)
+
+    def is_pipelining(self):
+        return SMTP_PIPELINING and "PIPELINING" in self.extensions
+
+    # Sends SMTP commands in one write and returns their whole replies, in the same order
+    def exchange(self, commands):
+        self.recipients_sent += sum(command.startswith("RCPT") for command in commands)
+
+        timeout = self.timeout()
+        self.sock.settimeout(timeout)
+        self.sock.sendall("".join(f"{command}\r\n" for command in commands).encode())
+        replies = [self.replies.read_reply(self.timeout()) for _ in commands]
+        self.last_used_at = time.monotonic()
+        return replies
+
+    # Sends SMTP commands in one write and returns the parsed responses
+    def commands(self, commands):
+        return [parse_smtp_response(reply) for reply in self.exchange(commands)]
+
+    # Sends an SMTP command and returns the parsed response
+    def command(self, command):
+        return self.commands([command])[0]
+
+    # Whether the session can still be reused
+    def is_reusable(self):
+        now = time.monotonic()
+        return (
+            self.sock is not None
+            and now - self.last_used_at < SMTP_POOL_IDLE_TIMEOUT
+            and now - self.opened_at < SMTP_POOL_MAX_AGE
+            and self.recipients_sent < SMTP_POOL_MAX_RECIPIENTS
+        )
+
+    # Ends the session politely and returns the reply to QUIT if we wait for it, None otherwise
+    def quit(self, wait_for_reply=False):
+        try:
+            if wait_for_reply:
+                return self.command("QUIT")
+            self.sock.sendall(b"QUIT\r\n")
+        except Exception:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+# Open sessions per mail server, reused with RSET to skip the connection, banner and EHLO round trips
+class SMTPConnectionPool:
+    def __init__(self):
+        # (host, port) -> idle sessions, the most recently used last
+        self.idle = {}
+        self.opened = 0
+        self.reused = 0
+        self._lock = threading.Lock()
+
+    # Returns an idle session of the mail server, reset for a new transaction,
+    # or a new session that still has to be opened
+    # The deadline of the check also bounds the wait for the reply to RSET
+    def acquire(self, host, port=None, deadline=None):
+        key = (host.lower(), SMTP_PORT if port is None else port)
+
+        while True:
+            with self._lock:
+                sessions = self.idle.get(key)
+                session = sessions.pop() if sessions else None
+                if sessions == []:
+                    del self.idle[key]
+
+            if session is None:
+                with self._lock:
+                    self.opened += 1
+                session = SMTPSession(host, port)
+                session.deadline = deadline
+                return session
+
+            if not session.is_reusable():
+                session.close()
+                continue
+
+            session.deadline = deadline
+
+            # The server may have dropped the session while it was idle
+            try:
+                reset = session.command("RSET")
+            except Exception:
+                reset = None
+
+            if is_accepted(reset):
+                with self._lock:
+                    self.reused += 1
+                return session
+
+            session.close()
+
+    # Gives back a session after a check, returns the reply to QUIT if the session was ended
+    # and wait_for_quit is set
+    # A check that waits for the reply to QUIT wants the whole conversation, its session is always ended
+    def release(self, session, is_healthy, wait_for_quit=False):
+        if wait_for_quit or not (is_healthy and session.is_reusable()):
+            return session.quit(wait_for_quit)
+
+        # The deadline was the one of the check that is over
+        session.deadline = None
+
+        key = (session.host.lower(), session.port)
+        with self._lock:
+            # Idle sessions are otherwise only looked at when their mail server is checked again
+            expired = self.remove_expired()
+
+            sessions = self.idle.setdefault(key, [])
+            is_kept = len(sessions) < SMTP_POOL_MAX_IDLE_PER_HOST
+            if is_kept:
+                sessions.append(session)
+                expired += self.remove_least_recently_used()
+
+        for idle in expired:
+            idle.close()
+
+        return None if is_kept else session.quit(wait_for_quit)
+
+    # Takes the idle sessions that can't be reused anymore out of the pool, to be closed
+    # Called with the lock held
+    def remove_expired(self):
+        expired = []
+        for key, sessions in list(self.idle.items()):
+            expired += [session for session in sessions if not session.is_reusable()]
+            sessions[:] = [session for session in sessions if session.is_reusable()]
+            if not sessions:
+                del self.idle[key]
+        return expired
+
+    # Takes the least recently used idle sessions out of the pool, to be closed,
+    # until at most SMTP_POOL_MAX_IDLE are left
+    # Called with the lock held
+    def remove_least_recently_used(self):
+        excess = (
+            sum(len(sessions) for sessions in self.idle.values()) - SMTP_POOL_MAX_IDLE
+        )
+        if excess <= 0:
+            return []
+
+        oldest = sorted(
+            (session for sessions in self.idle.values() for session in sessions),
+            key=lambda session: session.last_used_at,
+        )[:excess]
+        for session in oldest:
+            key = (session.host.lower(), session.port)
+            self.idle[key].remove(session)
+            if not self.idle[key]:
+                del self.idle[key]
+        return oldest
+
+    # Closes all idle sessions and resets the counters
+    def clear(self):
+        with self._lock:
+            sessions = [session for idle in self.idle.values() for session in idle]
+            self.idle.clear()
+            self.opened = 0
+            self.reused = 0
+
+        for session in sessions:
+            session.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hosts": len(self.idle),
+                "idle": sum(len(sessions) for sessions in self.idle.values()),
+                "opened": self.opened,
+                "reused": self.reused,
+            }
+
+
+smtp_pool = SMTPConnectionPool()
+
+
+# The mail transaction of check_recipients, independent of how commands are sent
+# Yields lists of commands to send together and is sent back their parsed replies,
+# the replies are stored in result
+# Without pipelining each command waits for the reply to the previous one, and the catch-all
+# test address is only sent if its recipient is accepted
+# With pipelining MAIL FROM and every RCPT TO, catch-all tests included, are sent at once
+# Returns whether the session is worth keeping: the server accepts our transactions and isn't closing it
+def transaction(result, recipients, pipelining=False):
+    mail_from_command = f"MAIL FROM: <{MAIL_FROM_ADDRESS}>"
+
+    if pipelining:
+        commands = [mail_from_command]
+        catch_all_tests = set()
+        for address, catch_all_test_address in recipients:
+            commands.append(f"RCPT TO: <{address}>")
+            if (
+                catch_all_test_address is not None
+                and catch_all_test_address not in catch_all_tests
+            ):
+                catch_all_tests.add(catch_all_test_address)
+                commands.append(f"RCPT TO: <{catch_all_test_address}>")
+
+        replies = iter((yield commands))
+        mail_from = next(replies)
+        result.greeting.append(mail_from)
+
+        for address, catch_all_test_address in recipients:
+            result.recipients[address] = next(replies)
+            if (
+                catch_all_test_address is not None
+                and catch_all_test_address not in result.catch_all_tests
+            ):
+                result.catch_all_tests[catch_all_test_address] = next(replies)
+
+    else:
+        (mail_from,) = yield [mail_from_command]
+        result.greeting.append(mail_from)
+
+        for address, catch_all_test_address in recipients:
+            (response,) = yield [f"RCPT TO: <{address}>"]
+            result.recipients[address] = response
+
+            if (
+                catch_all_test_address is not None
+                and catch_all_test_address not in result.catch_all_tests
+                and is_accepted(response)
+            ):
+                (result.catch_all_tests[catch_all_test_address],) = yield [
+                    f"RCPT TO: <{catch_all_test_address}>"
+                ]
+
+    replies = list(result.recipients.values()) + list(result.catch_all_tests.values())
+    return is_accepted(mail_from) and not any(
+        reply is None or reply["code"] == "421" for reply in replies
+    )
+
+
+# Runs a transaction, send(commands) returns the parsed replies to the commands
+def run_transaction(conversation, send):
+    try:
+        commands = next(conversation)
+        while True:
+            commands = conversation.send(send(commands))
+    except StopIteration as stop:
+        return stop.value
+
+
+# Asks the mail server whether it accepts emails for each recipient, in a single session
+# recipients is a list of (address, catch_all_test_address or None)
+# Each catch-all test address is checked once per session, to find out whether the server
+# accepts every address, right after the first of its recipients that is accepted
+# If the server supports pipelining, it is sent along with the other commands instead
+# With the pool enabled the session may be one left open by a previous check, and is
+# left open for the next one instead of being ended with QUIT
+# The check gives up after timeout seconds, at most SMTP_SESSION_TIMEOUT
+# The reply to QUIT is only waited for with wait_for_quit, e.g. for debugging
+# The check waits for its turn with the other checks on the same host and provider, see smtp_throttle
+# Returns an SMTPSessionResult with the replies received before the session ended or failed
+def check_recipients(
+    host, recipients, port=None, timeout=None, wait_for_quit=False, provider=None
+):
+    timeout = (
+        SMTP_SESSION_TIMEOUT if timeout is None else min(timeout, SMTP_SESSION_TIMEOUT)
+    )
+    wait_for_quit = wait_for_quit or SMTP_WAIT_FOR_QUIT_REPLY
+
+    if SMTP_ENGINE == "asyncio":
+        # Imported here because the asyncio engine builds on this module
+        from .smtp_async import smtp_async_engine
+
+        return smtp_async_engine.check_recipients(
+            host, recipients, port, timeout, wait_for_quit, provider
+        )
+
+    result = SMTPSessionResult(address for address, _ in recipients)
+    deadline = time.monotonic() + timeout
+
+    try:
+        smtp_throttles.acquire(host, provider, deadline)
+    except TimeoutError:
+        # We didn't get to talk to the server in time
+        result.is_throttle_timeout = True
+        return result
+
+    try:
+        run_session(host, port, recipients, result, deadline, wait_for_quit)
+    finally:
+        smtp_throttles.release(host, provider, result)
+
+    return result
+
+
+# Runs the check of check_recipients in a session and stores the replies in result
+def run_session(host, port, recipients, result, deadline, wait_for_quit):
+    if SMTP_POOL_ENABLED:
+        session = smtp_pool.acquire(host, port, deadline)
+    else:
+        session = SMTPSession(host, port)
+        session.deadline = deadline
+    is_finished = is_healthy = False
+
+    try:
+        try:
+            if session.sock is None:
+                session.open()
+        finally:
+            result.greeting.extend(session.greeting)
+
+        is_healthy = run_transaction(
+            transaction(result, recipients, session.is_pipelining()), session.commands
+        )
+        is_finished = True
+
+    except Exception:
+        # We report what we got until the failure
+        pass
+
+    finally:
+        if not is_finished:
+            session.close()
+        elif SMTP_POOL_ENABLED:
+            result.quit = smtp_pool.release(session, is_healthy, wait_for_quit)
+        else:
+            result.quit = session.quit(wait_for_quit)
@@ -0,0 +1,196 @@
+import asyncio
+import threading
+import time
+
+from decouple import config
+
+from .knowledge_base import smtp_phrase_stages
+from .phrase_matcher import smtp_message_phrases, strip_addresses
+
+# Maximum number of checks running at the same time on one mail server
+SMTP_HOST_MAX_CONCURRENCY = config("SMTP_HOST_MAX_CONCURRENCY", default=5, cast=int)
+
+# Maximum number of checks running at the same time on the mail servers of one provider
+SMTP_PROVIDER_MAX_CONCURRENCY = config(
+    "SMTP_PROVIDER_MAX_CONCURRENCY", default=20, cast=int
+)
+
+# Checks started per second on a mail server or provider, before any adjustment
+SMTP_RATE_INITIAL = config("SMTP_RATE_INITIAL", default=5, cast=float)
+
+# Bounds of the adjusted rate, in checks per second
+SMTP_RATE_MIN = config("SMTP_RATE_MIN", default=0.2, cast=float)
+SMTP_RATE_MAX = config("SMTP_RATE_MAX", default=50, cast=float)
+
+# The rate grows by this much after each check the server answered normally,
+# and is multiplied by SMTP_RATE_DECREASE when the server tells us to slow down
+SMTP_RATE_INCREASE = config("SMTP_RATE_INCREASE", default=0.5, cast=float)
+SMTP_RATE_DECREASE = config("SMTP_RATE_DECREASE", default=0.5, cast=float)
+
+# Mail servers and providers we keep limits for, the idle ones at the initial rate are forgotten first
+SMTP_THROTTLE_MAX_KEYS = config("SMTP_THROTTLE_MAX_KEYS", default=10000, cast=int)
+
+# How often a check waiting for a free slot looks again, in seconds
+POLL_INTERVAL = 0.05
+
+
+# Whether the replies of a check tell us to slow down:
+# 421 service not available, a 4.7.x policy deferral, or a refusal with a blacklist message
+# Replies accepting our commands don't count, many banners and EHLO replies mention spam
+def is_throttled(result):
+    replies = list(zip(("banner", "helo", "mail"), result.greeting)) + [
+        ("rcpt", reply)
+        for reply in list(result.recipients.values())
+        + list(result.catch_all_tests.values())
+        if reply is not None
+    ]
+
+    for stage, reply in replies:
+        if reply["code"] == "421" or (
+            reply["code"].startswith("4") and reply["subcode"].startswith("4.7.")
+        ):
+            return True
+
+        if (
+            reply["code"][:1] in ("4", "5")
+            and stage in smtp_phrase_stages["blacklist"]
+            and "blacklist"
+            in smtp_message_phrases.scan(strip_addresses(reply["message"].lower()))
+        ):
+            return True
+
+    return False
+
+
+# Concurrency and rate limit of one mail server or provider
+# The rate is a token bucket whose refill rate is adjusted by additive increase, multiplicative decrease
+class Throttle:
+    def __init__(self, max_concurrency):
+        self.max_concurrency = max_concurrency
+        self.active = 0
+        self.rate = SMTP_RATE_INITIAL
+
+        self.tokens = self.burst()
+        self.updated_at = time.monotonic()
+
+    # Tokens the bucket holds at most: one second of checks, at least one check
+    def burst(self):
+        return max(self.rate, 1)
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.tokens + (now - self.updated_at) * self.rate, self.burst()
+        )
+        self.updated_at = now
+
+    # Takes a slot and a token if both are available and returns 0,
+    # otherwise returns the seconds to wait before trying again
+    def try_acquire(self):
+        self.refill()
+        if self.active >= self.max_concurrency:
+            return POLL_INTERVAL
+        if self.tokens < 1:
+            return max((1 - self.tokens) / self.rate, POLL_INTERVAL)
+
+        self.active += 1
+        self.tokens -= 1
+        return 0
+
+    def release(self, is_throttled):
+        self.active = max(self.active - 1, 0)
+        if is_throttled:
+            self.rate = max(self.rate * SMTP_RATE_DECREASE, SMTP_RATE_MIN)
+            self.tokens = min(self.tokens, 0)
+        else:
+            self.rate = min(self.rate + SMTP_RATE_INCREASE, SMTP_RATE_MAX)
+
+    def is_idle(self):
+        return self.active == 0 and self.rate >= SMTP_RATE_INITIAL
+
+
+# The throttles of the mail servers and providers we talk to
+# A check holds a slot of its mail server and of its provider while it runs
+class SMTPThrottles:
+    def __init__(self):
+        self.throttles = {}
+        self._lock = threading.Lock()
+
+    # The throttles a check on the host goes through
+    def keys(self, host, provider=None):
+        keys = [("host", host.lower(), SMTP_HOST_MAX_CONCURRENCY)]
+        if provider:
+            keys.append(("provider", provider.lower(), SMTP_PROVIDER_MAX_CONCURRENCY))
+        return keys
+
+    def get(self, kind, name, max_concurrency):
+        throttle = self.throttles.get((kind, name))
+        if throttle is None:
+            if len(self.throttles) >= SMTP_THROTTLE_MAX_KEYS:
+                for key, other in list(self.throttles.items()):
+                    if other.is_idle():
+                        del self.throttles[key]
+
+            throttle = self.throttles[(kind, name)] = Throttle(max_concurrency)
+        return throttle
+
+    # Takes a slot of each throttle of the check, or returns the seconds to wait before trying again
+    def try_acquire(self, host, provider=None):
+        with self._lock:
+            throttles = [self.get(*key) for key in self.keys(host, provider)]
+            for index, throttle in enumerate(throttles):
+                wait = throttle.try_acquire()
+                if wait:
+                    # Give back what we took, so that the slots aren't held while waiting
+                    for taken in throttles[:index]:
+                        taken.active -= 1
+                        taken.tokens += 1
+                    return wait
+        return 0
+
+    # Waits until the check can start
+    # Raises TimeoutError if it can't start before the deadline
+    def acquire(self, host, provider=None, deadline=None):
+        while True:
+            wait = self.try_acquire(host, provider)
+            if not wait:
+                return
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise TimeoutError("Too many checks on this mail server")
+            time.sleep(wait)
+
+    # The same as acquire, for the asyncio engine
+    async def acquire_async(self, host, provider=None, deadline=None):
+        while True:
+            wait = self.try_acquire(host, provider)
+            if not wait:
+                return
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise TimeoutError("Too many checks on this mail server")
+            await asyncio.sleep(wait)
+
+    # Gives back the slots of a check and adjusts the rates from its replies
+    def release(self, host, provider, result):
+        throttled = is_throttled(result)
+        with self._lock:
+            for key in self.keys(host, provider):
+                self.get(*key).release(throttled)
+
+    def clear(self):
+        with self._lock:
+            self.throttles.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self.throttles),
+                "active": sum(throttle.active for throttle in self.throttles.values()),
+                "slowed_down": {
+                    f"{kind}:{name}": round(throttle.rate, 2)
+                    for (kind, name), throttle in self.throttles.items()
+                    if throttle.rate < SMTP_RATE_INITIAL
+                },
+            }
+
+
+smtp_throttles = SMTPThrottles()
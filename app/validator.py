@@ -1,17 +1,50 @@
 from .knowledge_base import *
+from .dns_cache import NEGATIVE_ERRORS, resolve
+from .concurrency import run_concurrently, spawn
+from .domain_profile import DomainProfile, domain_profiles, catch_all_verdicts
+from .domain_age_store import domain_age_store
+from .whois_client import whois_client
+from .phrase_matcher import smtp_message_phrases, strip_addresses
+from .role_accounts import role_accounts
+from .smtp_probe import check_recipients, is_greylisted, parse_smtp_response
 
 import dns.resolver
+import dns.reversename
 import tldextract
-import socket
 import re
-import subprocess
 import datetime
-from dateutil import parser
+import time
+from decouple import config
+
+# Run the NS, autodiscover and MX lookups concurrently instead of one after the other
+CONCURRENT_DNS_LOOKUPS = config("CONCURRENT_DNS_LOOKUPS", default=True, cast=bool)
+
+# Reported when the SMTP conversation fails in a way we don't handle
+SMTP_ERROR_DETAIL = (
+    "we encountered an error while trying to connect with the email provider"
+)
+
+# Look up the domain age in the background instead of waiting for it before the DNS lookups
+BACKGROUND_DOMAIN_AGE = config("BACKGROUND_DOMAIN_AGE", default=True, cast=bool)
+
+# Seconds after the validation started, after which we stop waiting for the background domain age lookup
+DOMAIN_AGE_DEADLINE = config("DOMAIN_AGE_DEADLINE", default=2, cast=float)
+
+# Seconds a validation can take when the request doesn't give its own time budget
+VALIDATION_TIME_BUDGET = config("VALIDATION_TIME_BUDGET", default=60, cast=float)
+
+# Largest time budget a request can ask for, in seconds
+VALIDATION_MAX_TIME_BUDGET = config(
+    "VALIDATION_MAX_TIME_BUDGET", default=300, cast=float
+)
+
+# The catch-all test is skipped when less than this many seconds are left for the SMTP conversation
+CATCH_ALL_MIN_TIME_LEFT = config("CATCH_ALL_MIN_TIME_LEFT", default=10, cast=float)
 
 
 # Everything reported about an email
 class Email:
-    def __init__(self, email, catch_all_test=False):
+    def __init__(self, email, catch_all_test=False, time_budget=None, debug=False):
         self.email = email
 
         # Is this instance used with a bogus email for catch all testing?
@@ -85,6 +118,12 @@ class Email:
         # SMTP responses parsed
         self.smtp_response = []
 
+        # SMTP response to the made up address we use for catch-all testing, if it was tested
+        self.catch_all_smtp_response = {}
+
+        # Whether the SMTP check gave up waiting for its turn with the mail server, see smtp_throttle
+        self.smtp_throttle_timeout = False
+
         # Catch-all (all accounts exist)
         self.has_catch_all = False
 
@@ -95,43 +134,143 @@ class Email:
         # Will soft bounce
         self.is_mailbox_full = False
 
+        # Was the check deferred, by the mail server, e.g. greylisting, or by our SMTP throttle?
+        # Checking again later is likely to give a verdict
+        self.is_greylisted = False
+
         # The phrases we found in the SMTP responses during verification
         self.phrase_matches = []
 
+        # (response, {list name: phrases found in its message}) for each SMTP response
+        self._phrase_hits = []
+
         # Verdict: Is the email valid?
         self.status = ""
         self.status_detail = ""
 
+        # The stages that were skipped because the time budget ran short
+        # domain_age, catch_all or smtp
+        self.skipped_stages = []
+
+        # Domain level results shared with the other emails on the same domain
+        self._domain_profile = None
+
+        # Whether a DNS lookup of the domain failed without an answer, e.g. timed out
+        self._dns_error = False
+
+        # Background lookup of the domain age, if it is running
+        self._domain_age_task = None
+
+        # When the validation started
+        self._started_at = time.monotonic()
+
+        # Seconds the validation can take
+        self._time_budget = (
+            VALIDATION_TIME_BUDGET if time_budget is None else time_budget
+        )
+
+        # Is this validation for debugging? Then we also wait for the reply to QUIT
+        self._debug = debug
+
     # Main method of this class
     def validate(self):
+        # If the checks before connecting to the mail server reached a verdict, no need to do the rest
+        if not self.run_checks_before_smtp():
+            return self.results()
+
+        # Connect to the mail server to validate the account
+        try:
+            self.evaluate_smtp_connection()
+        except Exception as a:
+            self.status = "unknown"
+            self.status_detail = SMTP_ERROR_DETAIL
+
+        # Return the results after all checks are done
+        # This is overwritten by quit_without_further_validations if the email is found to be invalid before all checks are completed
+        return self.results()
+
+    # Seconds left in the time budget of the validation
+    def time_left(self):
+        return self._started_at + self._time_budget - time.monotonic()
+
+    def skip_stage(self, stage):
+        if stage not in self.skipped_stages:
+            self.skipped_stages.append(stage)
+
+    # Runs every check up to the SMTP conversation
+    # Returns False if they were enough to reach a verdict
+    # domain_profile, if given, is the profile of another email on the same domain to reuse
+    def run_checks_before_smtp(self, domain_profile=None):
+        self._started_at = time.monotonic()
 
         # If the syntax isn't valid, no need to do the rest
         self.check_syntax()
         if not self.is_valid_syntax:
-            return self.quit_without_further_validations(
+            self.quit_without_further_validations(
                 "invalid", "email address did not pass the syntax check"
             )
+            return False
 
         self.parse_account()
         self.check_if_alias()
-        self.parse_domain()
-        self.get_domain_age()
+        self.parse_fqdn()
         self.parse_account_alias_stripped()
+
+        # Everything up to the SMTP conversation only depends on the domain,
+        # so it is done once per domain and reused by the other emails on that domain
+        self._domain_profile = self.get_domain_profile(domain_profile)
+
+        # If the domain alone decided the verdict, no need to do the rest
+        if self._domain_profile.status:
+            self.quit_without_further_validations(
+                self._domain_profile.status, self._domain_profile.status_detail
+            )
+            return False
+
+        return True
+
+    # Returns the profile of the email domain, from the cache if another email on it was validated recently
+    def get_domain_profile(self, profile=None):
+        if profile is None:
+            profile = domain_profiles.get_or_set(
+                self.fqdn, self.check_domain, ttl=DomainProfile.ttl
+            )
+        profile.apply_to(self)
+        return profile
+
+    # Runs the checks that only depend on the domain and returns their results as a profile
+    def check_domain(self):
+        self.parse_domain()
+
+        # Domain age is informational, so it can be looked up while we do the rest
+        if BACKGROUND_DOMAIN_AGE:
+            self._domain_age_task = spawn(self.get_domain_age)
+        else:
+            self.get_domain_age()
+
         self.check_if_free_provider()
 
-        # If the email domain doesn't have a name server, no need to do the rest
-        if not self.has_name_servers():
-            return self.quit_without_further_validations(
-                "invalid", "email domain does not have name servers"
+        has_name_servers = self.run_dns_lookups()
+
+        # A lookup that timed out tells nothing about the domain, this profile is not reused
+        if self._dns_error:
+            return DomainProfile.from_email(
+                self,
+                "unknown",
+                "we could not look up the email domain, try again later",
+                is_transient=True,
             )
 
-        self.parse_autodiscover()
-        self.parse_mx_record()
+        # If the email domain doesn't have a name server, no need to do the rest
+        if not has_name_servers:
+            return DomainProfile.from_email(
+                self, "invalid", "email domain does not have name servers"
+            )
 
         # If the email domain doesn't have an mx record, no need to do the rest
         if not self.has_mx_records:
-            return self.quit_without_further_validations(
-                "invalid", "email domain does not have emails set up"
+            return DomainProfile.from_email(
+                self, "invalid", "email domain does not have emails set up"
             )
 
         # Check the mx record against known disposable email providers
@@ -143,20 +282,45 @@ class Email:
         # Get the email provider based on the mx record
         self.find_email_provider()
 
-        # Connect to the mail server to validate the account
-        try:
-            self.evaluate_smtp_connection()
-        except Exception as a:
-            self.status = "unknown"
-            self.status_detail = "we encountered an error while trying to connect with the email provider"
-
-        # Return the results after all checks are done
-        # This is overwritten by quit_without_further_validations if the email is found to be invalid before all checks are completed
-        return self.results()
+        return DomainProfile.from_email(self)
 
     # Returns a dict with the current values of the results
+    # Attributes starting with an underscore are internal and not reported
     def results(self):
-        return vars(self)
+        self.join_domain_age()
+
+        return {
+            key: value for key, value in vars(self).items() if not key.startswith("_")
+        }
+
+    # Waits for the background domain age lookup until the deadline
+    # If it is not ready by then, domain_age stays -1 and the lookup keeps running to fill the caches
+    def join_domain_age(self):
+        if self._domain_age_task is None:
+            return
+
+        timeout = max(
+            min(
+                self._started_at + DOMAIN_AGE_DEADLINE - time.monotonic(),
+                self.time_left(),
+            ),
+            0,
+        )
+        try:
+            self.domain_age = self._domain_age_task.get(timeout=timeout)
+        except TimeoutError:
+            self.skip_stage("domain_age")
+            return
+
+        if "domain_age" in self.skipped_stages:
+            self.skipped_stages.remove("domain_age")
+
+        self._domain_age_task = None
+
+        # Back-fill the domain profile, so that the next emails on this domain don't need to wait
+        if self._domain_profile is not None:
+            self._domain_profile.facts["domain_age"] = self.domain_age
+            self._domain_profile.domain_age_task = None
 
     # Quit verification without further validations
     def quit_without_further_validations(self, status, status_detail):
@@ -181,9 +345,11 @@ class Email:
     def check_if_alias(self):
         self.is_alias = "+" in self.account
 
-    def parse_domain(self):
-        self.fqdn = self.email.split("@")[1]
+    # Domain names are case-insensitive, the lowercase name is the one looked up and cached
+    def parse_fqdn(self):
+        self.fqdn = self.email.split("@")[1].lower()
 
+    def parse_domain(self):
         extract = tldextract.extract(self.fqdn)
         self.subdomain, self.domain, self.tld = (
             extract.subdomain,
@@ -194,54 +360,76 @@ class Email:
     def get_domain_age(self):
         domain = f"{self.domain}.{self.tld}"
 
-        try:
-            # Run whois command and capture output
-            whois_output = subprocess.check_output(["whois", domain], timeout=2).decode(
-                "utf-8"
-            )
+        # Whois only runs for domains we haven't looked up before
+        is_stored, creation_date = domain_age_store.get(domain)
+        if not is_stored:
+            try:
+                creation_date = Email.lookup_creation_date(domain)
+            except Exception as e:
+                # We don't store failures like timeouts, so that they can be retried
+                return self.domain_age
 
-            # Look for creation date in whois output
-            for line in whois_output.splitlines():
-                if "Creation Date:" in line:
-                    creation_date_str = line.split("Creation Date:")[1].strip()
-                    creation_date = parser.parse(creation_date_str)
+            domain_age_store.set(domain, creation_date)
 
-                    # Calculate domain age
-                    current_date = datetime.datetime.now(datetime.timezone.utc)
-                    domain_age = current_date - creation_date
+        if creation_date is not None:
+            # Calculate domain age
+            current_date = datetime.datetime.now(datetime.timezone.utc)
+            domain_age = current_date - creation_date
 
-                    self.domain_age = domain_age.days
+            self.domain_age = domain_age.days
 
-        except Exception as e:
-            pass
+        return self.domain_age
+
+    # Finds the creation date of the domain with whois, None if whois doesn't report it
+    @staticmethod
+    def lookup_creation_date(domain):
+        return whois_client.lookup_creation_date(domain)
 
     def parse_account_alias_stripped(self):
         self.account_alias_stripped = self.account.split("+")[0]
         self.email_alias_stripped = self.account_alias_stripped + "@" + self.fqdn
-        self.is_role = self.account_alias_stripped in role_email_accounts
+        self.is_role = self.account_alias_stripped in role_accounts
 
     def check_if_free_provider(self):
         # Is fqdn in the free providers list?
-        self.is_free_provider = self.fqdn in free_email_domains
+        self.is_free_provider = self.fqdn in free_email_domains_index
 
     # Does the domain have name servers?
     def has_name_servers(self):
         try:
-            answers = dns.resolver.resolve(f"{self.domain}.{self.tld}", "NS")
+            answers = resolve(f"{self.domain}.{self.tld}", "NS")
             nameservers = [str(rdata) for rdata in answers]
             return True
         # TODO: More detailed reporting by error type
-        except dns.resolver.NoNameservers:
+        except NEGATIVE_ERRORS:
             return False
-        except dns.resolver.NXDOMAIN:
+        except Exception:
+            # e.g. a timeout, the domain may well have name servers
+            self._dns_error = True
             return False
-        except:
+
+    # Runs the NS, autodiscover and MX lookups
+    # Returns whether the domain has name servers
+    def run_dns_lookups(self):
+        # These lookups don't depend on each other, so we wait for roughly one round trip instead of three
+        if CONCURRENT_DNS_LOOKUPS:
+            has_name_servers, _, _ = run_concurrently(
+                self.has_name_servers, self.parse_autodiscover, self.parse_mx_record
+            )
+            return has_name_servers
+
+        # Sequential fallback, we skip the rest if there are no name servers
+        if not self.has_name_servers():
             return False
 
+        self.parse_autodiscover()
+        self.parse_mx_record()
+        return True
+
     # Get autodiscover cname record
     def parse_autodiscover(self):
         try:
-            answers = dns.resolver.resolve(f"autodiscover.{self.fqdn}", "CNAME")
+            answers = resolve(f"autodiscover.{self.fqdn}", "CNAME")
             self.autodiscover_host = answers[0].target.to_text()
             extract = tldextract.extract(self.autodiscover_host)
             self.autodiscover_domain, self.autodiscover_host_tld = (
@@ -255,7 +443,7 @@ class Email:
     @staticmethod
     def get_ip_address(hostname):
         try:
-            ip_address = socket.gethostbyname(hostname)
+            ip_address = resolve(hostname, "A")[0].address
             return ip_address
         except:
             return None
@@ -264,17 +452,17 @@ class Email:
     # Find the hostname from the IP address
     def get_ptr_record(ip_address):
         try:
-            ptr_record = socket.gethostbyaddr(ip_address)
-            return ptr_record[0]
+            ptr_record = resolve(dns.reversename.from_address(ip_address), "PTR")
+            return ptr_record[0].target.to_text()[:-1]
         except:
             return ""
 
     # Get mx records
     def parse_mx_record(self):
         try:
-            self.smtp_provider_host = dns.resolver.resolve(self.fqdn, "MX")[
-                0
-            ].exchange.to_text()[:-1]
+            self.smtp_provider_host = resolve(self.fqdn, "MX")[0].exchange.to_text()[
+                :-1
+            ]
             extract = tldextract.extract(self.smtp_provider_host)
             self.smtp_provider_host_domain, self.smtp_provider_host_tld = (
                 extract.domain,
@@ -283,12 +471,15 @@ class Email:
             self.smtp_provider_ip = Email.get_ip_address(self.smtp_provider_host)
             self.smtp_provider_ip_ptr = Email.get_ptr_record(self.smtp_provider_ip)
             self.has_mx_records = True
-        except:
+        except NEGATIVE_ERRORS:
             # We pass here because self.validate() will quit if has_mx_records is False
             pass
+        except Exception:
+            # e.g. a timeout, the domain may well have MX records
+            self._dns_error = True
 
     def check_if_disposable(self):
-        if self.smtp_provider_ip in disposable_smtp_provider_ips:
+        if self.smtp_provider_ip in disposable_smtp_provider_ips_index:
             self.is_disposable = True
 
     def check_for_security_gateway(self):
@@ -322,124 +513,175 @@ class Email:
     # Parse the SMTP response
     @staticmethod
     def parse_smtp_response(response):
-        # Parse the code
-        code = response[:3]
-
-        # Check if subcode exists
-        subcode_exists = (
-            response[4:5].isdigit()
-            and response[6:7].isdigit()
-            and response[8:9].isdigit()
-        )
+        return parse_smtp_response(response)
 
-        # Parse the subcode
-        subcode = response[4:9] if subcode_exists else ""
-
-        # Strip new lines, code-subcode and code-subcode patterns from message
-        message = (
-            response.replace(f"{code}", "")
-            .replace(f"{code}-", "")
-            .replace(f"{subcode}", "")
-            .replace("\r\n", " ")
-            .strip()
+    # Connects to the mail server and asks whether it accepts emails for this address
+    # If catch_all_test_email is given and the address is accepted, we also ask for that made up address
+    # in the same session to find out whether the server accepts every address
+    def make_bogus_smtp_connection(self, catch_all_test_email=None):
+        session = check_recipients(
+            self.smtp_provider_host,
+            [(self.email, catch_all_test_email)],
+            timeout=self.time_left(),
+            wait_for_quit=self._debug,
+            provider=self.email_provider,
         )
-
-        result = {"code": code, "subcode": subcode, "message": message}
-        return result
-
-    # We made this a static method because I
-    def make_bogus_smtp_connection(self):
-        # Define the server address and port
-        server_address = (self.smtp_provider_host, 25)
-
-        # Create a TCP socket
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-
-        # Parsed responses
-        response = []
-
-        try:
-            # Connect to the server
-            sock.connect(server_address)
-
-            # Send the HELO command
-            helo_command = "HELO fancydomain.com\r\n"
-            sock.sendall(helo_command.encode())
-
-            # Receive and print the server response
-            parsed_response = Email.parse_smtp_response(sock.recv(1024).decode())
-            response.append(parsed_response)
-
-            # Send the MAIL FROM command
-            mail_from_command = "MAIL FROM: <test@fancydomain.com>\r\n"
-            sock.sendall(mail_from_command.encode())
-
-            # Receive and print the server response
-            parsed_response = Email.parse_smtp_response(sock.recv(1024).decode())
-            response.append(parsed_response)
-
-            # Send the RCPT TO command
-            rcpt_to_command = f"RCPT TO: <{self.email}>\r\n"
-            sock.sendall(rcpt_to_command.encode())
-
-            # Receive and print the server response
-            parsed_response = Email.parse_smtp_response(sock.recv(1024).decode())
-            response.append(parsed_response)
-
-            # Send the QUIT command
-            quit_command = "QUIT\r\n"
-            sock.sendall(quit_command.encode())
-
-            # Receive and print the server response
-            parsed_response = Email.parse_smtp_response(sock.recv(1024).decode())
-            response.append(parsed_response)
-
-        finally:
-            # Close the socket
-            sock.close()
-
-            return response
+        self.catch_all_smtp_response = session.catch_all_tests.get(
+            catch_all_test_email, {}
+        )
+        self.smtp_throttle_timeout = session.is_throttle_timeout
+        return session.responses_for(self.email)
 
     # We use this function to remove the email address being tested from the messages
     # so that phrases in the email address which is mentioned in SMTP response messages
     # doesn't match our validation phrases
     @staticmethod
     def strip_email_being_tested(message):
-        return re.sub(r"<[^>]*>", "", message)
-
-    # Check if self.smtp_response contain a phrase from our lists
-    def response_matched_phrases_in_list(self, phrase_list):
-        # TODO: We can simplify this learning which message to check and only checking that message
+        return strip_addresses(message)
+
+    # Finds the phrases of all our lists in the SMTP response messages, in one pass per message
+    # Only the RCPT TO reply and refusals of the earlier commands are scanned,
+    # many mail servers mention spam in the banner or the EHLO reply
+    def scan_smtp_response(self):
+        self._phrase_hits = [
+            (
+                response,
+                smtp_message_phrases.scan(
+                    Email.strip_email_being_tested(response["message"].lower())
+                ),
+            )
+            for response in self.smtp_response
+            if response["stage"] == "rcpt"
+            or (response["stage"] != "quit" and response["code"][:1] in ("4", "5"))
+        ]
+
+    # Check if self.smtp_response contain a phrase from one of our lists, by its name in smtp_message_phrases
+    # Only the replies of the stages in smtp_phrase_stages count for the list
+    def response_matched_phrases(self, list_name):
         matched = False
-        # Loop all messages in the response
-        for response in self.smtp_response:
-            # Loop all messages in list
-            for phrase in phrase_list:
-                if phrase.lower() in Email.strip_email_being_tested(
-                    response["message"].lower()
-                ):
-                    matched = True
-                    self.phrase_matches.append((phrase, response["message"]))
+        for response, hits in self._phrase_hits:
+            if response["stage"] not in smtp_phrase_stages[list_name]:
+                continue
+
+            for phrase in hits.get(list_name, []):
+                matched = True
+                self.phrase_matches.append((phrase, response["message"]))
 
         return matched
 
+    # The verdict of the SMTP responses from their codes, looked up in smtp_reply_verdicts
+    # None if no reply has codes that tell what it means
+    def reply_verdict(self):
+        for response in self.smtp_response:
+            stage = response["stage"]
+            code, subcode = response["code"], response["subcode"]
+            verdict = smtp_reply_verdicts.get((stage, code, subcode))
+            if verdict is None and code[:1] == subcode[:1]:
+                verdict = smtp_reply_verdicts.get((stage, "", subcode))
+            if verdict is not None:
+                return verdict
+        return None
+
+    # Sets the status from the codes of the SMTP responses when they are clear, from their phrases otherwise
+    def classify_smtp_response(self):
+        verdict = self.reply_verdict()
+        if verdict is not None:
+            self.apply_verdict(verdict)
+            return
+
+        self.scan_smtp_response()
+        for list_name in smtp_message_phrases.phrase_lists:
+            if self.response_matched_phrases(list_name):
+                self.apply_verdict(list_name)
+
+    # Sets the status for a verdict, the name of one of our phrase lists
+    def apply_verdict(self, verdict):
+        # Check if this is a disabled address
+        if verdict == "account_disabled":
+            self.is_likely_spam_trap = True
+            self.status = "disabled"
+            self.status_detail = (
+                "email provider confirmed that the email address is disabled"
+            )
+
+        # Check if this is a full mailbox case
+        elif verdict == "mailbox_full":
+            self.status = "valid"
+            self.status_detail = "email address exists but mailbox is full"
+            self.is_mailbox_full = True
+
+        # Check if this is an invalid email address case
+        elif verdict == "invalid_email":
+            self.status = "invalid"
+            self.status_detail = (
+                "email provider confirmed that email address does not exist"
+            )
+
+        # Check if this is a case where we are blacklisted
+        elif verdict == "blacklist":
+            self.status = "unknown"
+            self.status_detail = "email provider does not allow us to validate"
+
+    # The made up address we check to find out whether the domain has a catch-all inbox
+    # None if we already know it
+    # The catch-all test is done once per domain in a while, in the same SMTP session
+    # as the first address that the mail server accepts, then its verdict is reused
+    def get_catch_all_test_email(self):
+        if self.is_catch_all_test or catch_all_verdicts.get(self.fqdn) is not None:
+            return None
+        return "34cq0f89unymc43fn0um" + "@" + self.fqdn
+
     def evaluate_smtp_connection(self):
+        time_left = self.time_left()
+
+        # If the time budget is spent, we can't ask the mail server
+        if time_left <= 0:
+            self.skip_stage("smtp")
+            self.status = "unknown"
+            self.status_detail = (
+                "we ran out of time before connecting to the email provider"
+            )
+            return
+
+        # The catch-all test is one more command, left out when time is short
+        catch_all_test_email = self.get_catch_all_test_email()
+        if catch_all_test_email is not None and time_left < CATCH_ALL_MIN_TIME_LEFT:
+            self.skip_stage("catch_all")
+            catch_all_test_email = None
+
         # Obtain the SMTP responses
-        self.smtp_response = self.make_bogus_smtp_connection()
+        self.smtp_response = self.make_bogus_smtp_connection(catch_all_test_email)
+
+        self.evaluate_smtp_response()
 
+    # Decides the status from self.smtp_response and self.catch_all_smtp_response
+    def evaluate_smtp_response(self):
         # If this is the bogus email we are testing
         # we already obtained the smtp response codes, we can exit
         if self.is_catch_all_test:
             return None
 
+        # If we gave up waiting for our turn with the mail server, it wasn't asked anything
+        elif self.smtp_throttle_timeout:
+            self.is_greylisted = True
+            self.status = "unknown"
+            self.status_detail = "we are checking too many emails of this email provider, try again later"
+
+        # If the session ended before the RCPT TO reply, only a refusal of our connection tells something
+        elif len(self.smtp_response) < 4:
+            self.classify_smtp_response()
+            if self.status == "":
+                self.status = "unknown"
+                self.status_detail = SMTP_ERROR_DETAIL
+
         # If this is not our bogus email address we are testing
         else:
-            # If the mail server returns 250 or 251 in the 3rd response
+            # If the mail server returns 250 or 251 to the RCPT TO command (4th response, after the banner, EHLO and MAIL FROM)
             # we know that the email is deliverable but we don't know
             # whether this is because the domain has a catch all address
             if (
-                self.smtp_response[2]["code"] == "250"
-                or self.smtp_response[2]["code"] == "251"
+                self.smtp_response[3]["code"] == "250"
+                or self.smtp_response[3]["code"] == "251"
             ):
 
                 # Either way, sending to this address will work since it returned 250
@@ -448,51 +690,24 @@ class Email:
                     "email provider confirmed that the email address is deliverable"
                 )
 
-                # To test if it responds 250 for all addresses, we make up an address
-                bogus_email_for_catch_all_testing = (
-                    "34cq0f89unymc43fn0um" + "@" + self.fqdn
-                )
-
-                # Then try to validate that
-                # TODO: We can save execution time by not running all then verifications for it
-                instance_for_catch_all_testing = Email(
-                    bogus_email_for_catch_all_testing, True
-                )
-                bogus_address_result = instance_for_catch_all_testing.validate()
-
-                # If the mail server returns 250 or 251 for our bogus email address as well,
+                # If the mail server returns 250 or 251 for our made up address as well,
                 # we know that is has a catch all inbox
-                if (
-                    bogus_address_result["smtp_response"][3]["code"] == "250"
-                    or bogus_address_result["smtp_response"][3]["code"] == "251"
-                ):
-                    self.has_catch_all = True
-
-            # Check if this is a disabled address
-            if self.response_matched_phrases_in_list(account_disabled_messages):
-                self.is_likely_spam_trap = True
-                self.status = "disabled"
-                self.status_detail = (
-                    "email provider confirmed that the email address is disabled"
-                )
+                # A 4xx reply, e.g. greylisting, says neither, so it isn't kept as a verdict
+                has_catch_all = catch_all_verdicts.get(self.fqdn)
+                catch_all_code = self.catch_all_smtp_response.get("code", "")
+                if catch_all_code[:1] in ("2", "5"):
+                    has_catch_all = catch_all_code == "250" or catch_all_code == "251"
+                    catch_all_verdicts.set(self.fqdn, has_catch_all)
 
-            # Check if this is a full mailbox case
-            if self.response_matched_phrases_in_list(mailbox_full_messages):
-                self.status = "valid"
-                self.status_detail = "email address exists but mailbox is full"
-                self.is_mailbox_full = True
+                self.has_catch_all = bool(has_catch_all)
 
-            # Check if this is an invalid email address case
-            if self.response_matched_phrases_in_list(invalid_email_messages):
-                self.status = "invalid"
-                self.status_detail = (
-                    "email provider confirmed that email address does not exist"
-                )
+            self.classify_smtp_response()
 
-            # Check if this is a case where we are blacklisted
-            if self.response_matched_phrases_in_list(blacklist_messages):
+            # If the mail server deferred the address, only a retry later can tell
+            self.is_greylisted = is_greylisted(self.smtp_response[3])
+            if self.status == "" and self.is_greylisted:
                 self.status = "unknown"
-                self.status_detail = "email provider does not allow us to validate"
+                self.status_detail = "email provider asked us to try again later"
 
             # If nothing above set a status
             if self.status == "":
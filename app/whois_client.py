@@ -0,0 +1,232 @@
+import asyncio
+import datetime
+import re
+import socket
+import time
+
+import requests
+from dateutil import parser
+from decouple import config
+
+# Time limit for a whole lookup, including the referral to find the whois server
+WHOIS_TIMEOUT = config("WHOIS_TIMEOUT", default=2, cast=float)
+
+# Try RDAP over HTTP before falling back to whois on port 43
+WHOIS_USE_RDAP = config("WHOIS_USE_RDAP", default=False, cast=bool)
+
+# RDAP bootstrap service that redirects to the registry of the domain
+RDAP_URL = config("RDAP_URL", default="https://rdap.org/domain/")
+
+# IANA knows the whois server of every TLD, we ask it for TLDs missing from the table below
+IANA_WHOIS_SERVER = "whois.iana.org"
+
+# Whois servers of the registries we see most often
+WHOIS_SERVERS = {
+    "com": "whois.verisign-grs.com",
+    "net": "whois.verisign-grs.com",
+    "org": "whois.pir.org",
+    "info": "whois.nic.info",
+    "biz": "whois.nic.biz",
+    "io": "whois.nic.io",
+    "co": "whois.nic.co",
+    "me": "whois.nic.me",
+    "us": "whois.nic.us",
+    "ai": "whois.nic.ai",
+    "xyz": "whois.nic.xyz",
+    "app": "whois.nic.google",
+    "dev": "whois.nic.google",
+    "uk": "whois.nic.uk",
+    "de": "whois.denic.de",
+    "fr": "whois.nic.fr",
+    "nl": "whois.domain-registry.nl",
+    "eu": "whois.eu",
+    "ca": "whois.cira.ca",
+    "au": "whois.auda.org.au",
+    "tr": "whois.trabis.gov.tr",
+}
+
+# Labels registries use for the creation date
+creation_date_pattern = re.compile(
+    r"^\s*(?:creation date|created on|created|registered on|registration time"
+    r"|domain registration date|record created|registered):\s*(.+?)\s*$",
+    re.IGNORECASE,
+)
+
+# How IANA refers to the whois server of a TLD
+referral_pattern = re.compile(r"^\s*(?:refer|whois):\s*(\S+)\s*$", re.IGNORECASE)
+
+
+# Parses a creation date, dates without a timezone are in UTC
+# Returns None if the value is not a date we can read
+def parse_creation_date(value):
+    try:
+        creation_date = parser.parse(value)
+    except (ValueError, OverflowError):
+        return None
+
+    if creation_date.tzinfo is None:
+        creation_date = creation_date.replace(tzinfo=datetime.timezone.utc)
+    return creation_date
+
+
+# Scans whois output as it arrives and stops at the first line matching the pattern
+class LineScanner:
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.buffer = b""
+        self.match = None
+
+    # Returns True once a matching line is found
+    def feed(self, chunk):
+        self.buffer += chunk
+        *lines, self.buffer = self.buffer.split(b"\n")
+        return any(self.scan_line(line) for line in lines)
+
+    # Scans the last line, which may not end with a new line
+    def close(self):
+        self.scan_line(self.buffer)
+        self.buffer = b""
+
+    def scan_line(self, line):
+        if self.match is not None:
+            return True
+        match = self.pattern.match(line.decode("utf-8", "replace"))
+        if match is None:
+            return False
+        self.match = match.group(1)
+        return True
+
+
+class WhoisClient:
+    def __init__(
+        self,
+        servers=WHOIS_SERVERS,
+        iana_server=IANA_WHOIS_SERVER,
+        port=43,
+        timeout=WHOIS_TIMEOUT,
+        use_rdap=WHOIS_USE_RDAP,
+        rdap_url=RDAP_URL,
+    ):
+        # Copied, because servers learnt from IANA are added to it
+        self.servers = dict(servers)
+        self.iana_server = iana_server
+        self.port = port
+        self.timeout = timeout
+        self.use_rdap = use_rdap
+        self.rdap_url = rdap_url
+
+    # Sends the query and reads the response until a line matches the pattern
+    # Returns the matched value, or None if the response ended without a match
+    def query(self, server, query, pattern, deadline):
+        scanner = LineScanner(pattern)
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError()
+
+        with socket.create_connection((server, self.port), timeout=remaining) as sock:
+            sock.sendall(query.encode("idna") + b"\r\n")
+
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError()
+                sock.settimeout(remaining)
+
+                chunk = sock.recv(4096)
+                if not chunk:
+                    break
+
+                # We stop reading as soon as we have what we need
+                if scanner.feed(chunk):
+                    return scanner.match
+
+        scanner.close()
+        return scanner.match
+
+    # Finds the whois server of the TLD, asking IANA if we don't know it
+    def find_server(self, tld, deadline):
+        if tld not in self.servers:
+            self.servers[tld] = self.query(
+                self.iana_server, tld, referral_pattern, deadline
+            )
+        return self.servers[tld]
+
+    # Returns the creation date of the domain from whois, None if it is not reported
+    def lookup_creation_date_whois(self, domain, deadline):
+        tld = domain.rsplit(".", 1)[-1].lower()
+        server = self.find_server(tld, deadline)
+        if server is None:
+            return None
+
+        value = self.query(server, domain, creation_date_pattern, deadline)
+        return parse_creation_date(value) if value else None
+
+    # Returns the creation date of the domain from RDAP, None if it is not reported
+    def lookup_creation_date_rdap(self, domain, deadline):
+        response = requests.get(
+            self.rdap_url + domain, timeout=max(deadline - time.monotonic(), 0.01)
+        )
+        response.raise_for_status()
+
+        for event in response.json().get("events", []):
+            if event.get("eventAction") == "registration":
+                return parse_creation_date(event["eventDate"])
+
+        return None
+
+    # Returns the creation date of the domain, None if the registry doesn't report it
+    # Raises if the lookup fails, e.g. on timeouts
+    def lookup_creation_date(self, domain):
+        deadline = time.monotonic() + self.timeout
+
+        if self.use_rdap:
+            try:
+                return self.lookup_creation_date_rdap(domain, deadline)
+            except Exception:
+                # Not every registry has RDAP, whois is the fallback
+                pass
+
+        return self.lookup_creation_date_whois(domain, deadline)
+
+    # Same as query, for asyncio callers
+    async def query_async(self, server, query, pattern):
+        scanner = LineScanner(pattern)
+        reader, writer = await asyncio.open_connection(server, self.port)
+
+        try:
+            writer.write(query.encode("idna") + b"\r\n")
+            await writer.drain()
+
+            while True:
+                chunk = await reader.read(4096)
+                if not chunk:
+                    break
+                if scanner.feed(chunk):
+                    return scanner.match
+        finally:
+            writer.close()
+
+        scanner.close()
+        return scanner.match
+
+    # Same as lookup_creation_date over whois, for asyncio callers
+    async def lookup_creation_date_async(self, domain):
+        async def lookup():
+            tld = domain.rsplit(".", 1)[-1].lower()
+            if tld not in self.servers:
+                self.servers[tld] = await self.query_async(
+                    self.iana_server, tld, referral_pattern
+                )
+            if self.servers[tld] is None:
+                return None
+
+            value = await self.query_async(
+                self.servers[tld], domain, creation_date_pattern
+            )
+            return parse_creation_date(value) if value else None
+
+        return await asyncio.wait_for(lookup(), self.timeout)
+
+
+whois_client = WhoisClient()
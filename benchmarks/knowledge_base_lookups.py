@@ -0,0 +1,75 @@
+"""Compares the cost of one knowledge base lookup in its list and in its frozenset index.
+
+Each lookup is measured for an entry near the start of the list, one near the end
+and one that isn't there, which is what most emails look up. The role accounts are
+also checked with the trie of role_accounts, which matches prefix entries too.
+
+    python benchmarks/knowledge_base_lookups.py --number 20000
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.knowledge_base import (  # noqa: E402
+    disposable_smtp_provider_ips,
+    disposable_smtp_provider_ips_index,
+    free_email_domains,
+    free_email_domains_index,
+    role_email_accounts,
+    role_email_accounts_index,
+)
+from app.role_accounts import RoleAccounts, role_accounts  # noqa: E402
+
+LOOKUPS = [
+    ("role accounts", role_email_accounts, role_email_accounts_index, "jane.doe"),
+    ("free domains", free_email_domains, free_email_domains_index, "example.com"),
+    (
+        "disposable IPs",
+        disposable_smtp_provider_ips,
+        disposable_smtp_provider_ips_index,
+        "203.0.113.7",
+    ),
+]
+
+
+def measure(collection, key, number):
+    return timeit.timeit(lambda: key in collection, number=number) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'':16} {'entry':>8} {'list':>10} {'frozenset':>10}")
+    for name, entries, index, missing in LOOKUPS:
+        for position, key in [
+            ("first", entries[0]),
+            ("last", entries[-1]),
+            ("missing", missing),
+        ]:
+            print(
+                f"{name:16} {position:>8} "
+                f"{measure(entries, key, args.number) * 1e9:8.0f}ns "
+                f"{measure(index, key, args.number) * 1e9:8.0f}ns"
+            )
+
+    # The trie takes one step per character of the account, not per entry
+    print()
+    grown = [f"{entry}{copy}" for copy in range(10) for entry in role_email_accounts]
+    for trie, size in [
+        (role_accounts, len(role_email_accounts)),
+        (RoleAccounts(grown), len(grown)),
+    ]:
+        print(
+            f"role accounts trie, {size:5} entries "
+            f"{measure(trie, 'jane.doe', args.number) * 1e9:8.0f}ns"
+        )
+
+
+if __name__ == "__main__":
+    main()
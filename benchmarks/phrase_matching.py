@@ -0,0 +1,101 @@
+"""Compares the phrase matching of SMTP responses before and after the single-pass matcher.
+
+The loop scans every response for every phrase of the four lists, lowercasing and stripping
+the message again for each phrase, like response_matched_phrases_in_list did. The matcher
+normalizes each message once and finds the phrases of all lists in one pass.
+
+    python benchmarks/phrase_matching.py --rounds 2000
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.knowledge_base import (  # noqa: E402
+    account_disabled_messages,
+    blacklist_messages,
+    invalid_email_messages,
+    mailbox_full_messages,
+)
+from app.validator import Email, smtp_message_phrases  # noqa: E402
+
+# The responses of a typical rejected address: banner, EHLO, MAIL FROM, RCPT TO and QUIT
+RESPONSES = [
+    {"message": "mx.example.com ESMTP Postfix - No UCE, no spam"},
+    {"message": "mx.example.com Hello [203.0.113.7], pleased to meet you"},
+    {"message": "Sender <verification@example.org> OK"},
+    {
+        "message": "<jane.doe@example.com>: Recipient address rejected: "
+        "The email account that you tried to reach does not exist"
+    },
+    {"message": "Bye"},
+]
+
+PHRASE_LISTS = [
+    account_disabled_messages,
+    mailbox_full_messages,
+    invalid_email_messages,
+    blacklist_messages,
+]
+
+
+def loop_per_phrase(responses):
+    matches = []
+    for phrase_list in PHRASE_LISTS:
+        for response in responses:
+            for phrase in phrase_list:
+                if phrase.lower() in re.sub(
+                    r"<[^>]*>", "", response["message"].lower()
+                ):
+                    matches.append((phrase, response["message"]))
+    return matches
+
+
+def single_pass(responses):
+    hits = [
+        (
+            response,
+            smtp_message_phrases.scan(
+                Email.strip_email_being_tested(response["message"].lower())
+            ),
+        )
+        for response in responses
+    ]
+
+    matches = []
+    for name in smtp_message_phrases.phrase_lists:
+        for response, found in hits:
+            for phrase in found.get(name, []):
+                matches.append((phrase, response["message"]))
+    return matches
+
+
+def measure(function, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        function(RESPONSES)
+    return (time.perf_counter() - started) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    assert loop_per_phrase(RESPONSES) == single_pass(RESPONSES)
+
+    for name, function in [
+        ("loop per phrase", loop_per_phrase),
+        ("single pass", single_pass),
+    ]:
+        print(
+            f"{name:16} {measure(function, args.rounds) * 1e6:8.1f} µs per validation"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Compares how many SMTP sessions the socket and asyncio engines hold at the same time.
+
+A local asyncio mail server delays every reply by --latency seconds to stand in for
+the round trips to a remote mail server. The socket engine runs its sessions on a pool
+of --threads threads, like validations outside gevent, the asyncio engine runs them
+all on its event loop.
+
+    python benchmarks/smtp_engines.py --sessions 2000 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import os
+import resource
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app import smtp_probe, smtp_throttle  # noqa: E402
+from app.concurrency import THREAD_POOL_SIZE  # noqa: E402
+from app.smtp_async import AsyncSMTPEngine  # noqa: E402
+
+
+# A mail server that accepts every recipient after a delay and counts its open sessions
+class SlowSMTPServer:
+    def __init__(self, latency):
+        self.latency = latency
+        self.open_sessions = 0
+        self.max_open_sessions = 0
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self.handle, "127.0.0.1", 0, backlog=4096)
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+    async def reply(self, writer, text):
+        await asyncio.sleep(self.latency)
+        writer.write(f"{text}\r\n".encode())
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        self.open_sessions += 1
+        self.max_open_sessions = max(self.max_open_sessions, self.open_sessions)
+        try:
+            await self.reply(writer, "220 slow.test ESMTP")
+            async for line in reader:
+                if line.upper().startswith(b"QUIT"):
+                    await self.reply(writer, "221 Bye")
+                    break
+                await self.reply(writer, "250 OK")
+        finally:
+            self.open_sessions -= 1
+            writer.close()
+
+    def reset(self):
+        self.max_open_sessions = 0
+
+
+def run_socket_engine(server, sessions, threads):
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(
+            executor.map(
+                lambda i: smtp_probe.check_recipients(
+                    "127.0.0.1", [(f"user{i}@slow.test", None)], server.port
+                ),
+                range(sessions),
+            )
+        )
+
+
+def run_asyncio_engine(server, sessions, threads):
+    engine = AsyncSMTPEngine(max_sessions=sessions)
+    return engine.check_many(
+        [
+            ("127.0.0.1", [(f"user{i}@slow.test", None)], server.port)
+            for i in range(sessions)
+        ]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--threads", type=int, default=THREAD_POOL_SIZE)
+    args = parser.parse_args()
+
+    # Each session uses a socket on both ends
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    # Every session has to reach the server, not an idle pooled connection
+    smtp_probe.SMTP_POOL_ENABLED = False
+
+    # The local server doesn't need protecting from us
+    smtp_throttle.SMTP_HOST_MAX_CONCURRENCY = args.sessions
+    smtp_throttle.SMTP_RATE_INITIAL = smtp_throttle.SMTP_RATE_MAX = float("inf")
+
+    server = SlowSMTPServer(args.latency)
+    print(
+        f"{args.sessions} sessions, {args.latency * 1000:.0f} ms per reply, "
+        f"{args.threads} threads for the socket engine"
+    )
+
+    for name, run in [("socket", run_socket_engine), ("asyncio", run_asyncio_engine)]:
+        server.reset()
+        start = time.perf_counter()
+        results = run(server, args.sessions, args.threads)
+        elapsed = time.perf_counter() - start
+
+        accepted = sum(
+            smtp_probe.is_accepted(result.recipients[f"user{i}@slow.test"])
+            for i, result in enumerate(results)
+        )
+        print(
+            f"{name:>8}: {elapsed:6.2f} s, {args.sessions / elapsed:8.1f} sessions/s, "
+            f"{server.max_open_sessions:5} at the same time, {accepted} accepted"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import socketserver
+import threading
+import time
+
+
+# Handles one SMTP session with canned replies
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        server.sessions += 1
+        self.reply(server.banner)
+
+        for line in self.rfile:
+            command = line.decode().strip()
+            server.commands.append(command)
+            verb = command.split(" ")[0].upper()
+
+            if verb == "HELO":
+                self.reply("250 fake.test")
+            elif verb == "EHLO" and server.esmtp:
+                lines = ["fake.test"] + list(server.extensions)
+                self.reply(
+                    "\r\n".join(
+                        f"250{'-' if i < len(lines) - 1 else ' '}{text}"
+                        for i, text in enumerate(lines)
+                    )
+                )
+            elif verb == "MAIL":
+                self.reply("250 2.1.0 OK")
+            elif verb == "RCPT":
+                address = command.split("<")[1].split(">")[0]
+                if server.catch_all or address in server.mailboxes:
+                    self.reply("250 2.1.5 OK")
+                else:
+                    self.reply(server.rejection)
+            elif verb in ("RSET", "NOOP"):
+                self.reply("250 2.0.0 OK")
+            elif verb == "QUIT":
+                self.reply("221 2.0.0 Bye")
+                return
+            else:
+                self.reply("502 5.5.1 Unrecognized command")
+
+    def reply(self, text):
+        time.sleep(self.server.delay)
+        self.wfile.write(f"{text}\r\n".encode())
+
+
+# A local stand-in for a mail server
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self,
+        mailboxes=(),
+        catch_all=False,
+        banner="220 fake.test ESMTP ready",
+        extensions=(),
+        rejection="550 5.1.1 The email account that you tried to reach does not exist",
+        delay=0,
+        esmtp=True,
+    ):
+        super().__init__(("127.0.0.1", 0), FakeSMTPHandler)
+        self.mailboxes = set(mailboxes)
+        self.catch_all = catch_all
+        self.banner = banner
+        self.extensions = extensions
+        self.rejection = rejection
+
+        # Seconds the server waits before each reply
+        self.delay = delay
+
+        # Whether the server understands EHLO
+        self.esmtp = esmtp
+        self.sessions = 0
+        self.commands = []
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
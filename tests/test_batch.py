@@ -0,0 +1,198 @@
+import concurrent.futures
+import json
+import threading
+import unittest
+from unittest import mock
+
+import dns.exception
+import dns.resolver
+
+from app import app
+from app import batch
+from app.batch import iter_batch_results, validate_batch
+from app.domain_profile import catch_all_verdicts, domain_profiles
+from app.smtp_probe import smtp_pool
+from app.validator import Email
+from fake_smtp import FakeSMTPServer
+
+
+# Every domain is served by the fake mail server on localhost
+def fake_resolve(qname, rdtype):
+    if str(qname).startswith("dead"):
+        raise dns.resolver.NXDOMAIN()
+    if rdtype == "CNAME":
+        raise dns.resolver.NoAnswer()
+    record = mock.Mock()
+    record.exchange.to_text.return_value = "localhost."
+    record.target.to_text.return_value = "localhost."
+    record.address = "127.0.0.1"
+    return [record]
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        domain_profiles.clear()
+        catch_all_verdicts.clear()
+        smtp_pool.clear()
+        for patcher in [
+            mock.patch("app.validator.resolve", side_effect=fake_resolve),
+            mock.patch.object(Email, "get_domain_age", return_value=-1),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def validate(self, server, addresses, max_recipients=20):
+        with mock.patch("app.smtp_probe.SMTP_PORT", server.port), mock.patch(
+            "app.batch.SMTP_MAX_RECIPIENTS_PER_SESSION", max_recipients
+        ):
+            return validate_batch(addresses)
+
+    def test_groups_emails_by_mail_server(self):
+        addresses = [
+            "jane@one.test",
+            "john@one.test",
+            "not-an-email",
+            "jane@two.test",
+            "john@dead.test",
+        ]
+        with FakeSMTPServer(mailboxes=["jane@one.test", "jane@two.test"]) as server:
+            results = self.validate(server, addresses)
+
+        self.assertEqual(server.sessions, 1)
+        self.assertEqual([result["email"] for result in results], addresses)
+        self.assertEqual(
+            [result["status"] for result in results],
+            ["valid", "invalid", "invalid", "valid", "invalid"],
+        )
+        self.assertEqual(results[0]["smtp_response"][3]["code"], "250")
+        self.assertEqual(results[1]["smtp_response"][3]["code"], "550")
+        self.assertEqual(results[0].keys(), Email("x@y.z").results().keys())
+
+        # One catch-all test per domain
+        rcpt = [command for command in server.commands if command.startswith("RCPT")]
+        self.assertEqual(len(rcpt), 5)
+
+    def test_respects_the_recipient_limit(self):
+        addresses = [f"user{i}@one.test" for i in range(5)]
+        with FakeSMTPServer(catch_all=True) as server:
+            results = self.validate(server, addresses, max_recipients=3)
+
+        # 5 addresses and one catch-all test, at most 3 RCPT TO per session,
+        # the second session reuses the connection of the first
+        self.assertEqual(server.sessions, 1)
+        self.assertEqual(server.commands.count("RSET"), 1)
+        self.assertTrue(all(result["has_catch_all"] for result in results))
+
+    def test_domain_is_resolved_once_even_when_lookups_time_out(self):
+        lookups = []
+
+        def timing_out_resolve(qname, rdtype):
+            lookups.append((str(qname), rdtype))
+            raise dns.exception.Timeout()
+
+        addresses = [f"user{i}@slow.test" for i in range(5)]
+        with mock.patch("app.validator.resolve", side_effect=timing_out_resolve):
+            results = validate_batch(addresses)
+
+        # The profile of the first email isn't cached, the others reuse it anyway
+        self.assertEqual(len(lookups), len(set(lookups)))
+        self.assertEqual(len(domain_profiles), 0)
+        self.assertEqual({result["status"] for result in results}, {"unknown"})
+
+    def test_windows_do_not_take_the_shared_executor(self):
+        # Both windows are running before either checks a domain, each would hold
+        # one of the two threads its domain checks wait for
+        barrier = threading.Barrier(2, timeout=5)
+        run_checks_before_smtp = batch.run_checks_before_smtp
+
+        def run_checks_together(emails, emit):
+            barrier.wait()
+            return run_checks_before_smtp(emails, emit)
+
+        results = {}
+
+        def validate(name):
+            results[name] = validate_batch([f"{name}@dead.test"])
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(executor.shutdown, wait=False)
+        with mock.patch("app.concurrency._executor", executor), mock.patch(
+            "app.batch.run_checks_before_smtp", side_effect=run_checks_together
+        ):
+            threads = [
+                threading.Thread(target=validate, args=(name,), daemon=True)
+                for name in ("jane", "john")
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(10)
+
+        self.assertEqual(sorted(results), ["jane", "john"])
+
+    def test_throttle_timeouts_are_deferred(self):
+        with FakeSMTPServer(mailboxes=["jane@one.test"]) as server, mock.patch(
+            "app.smtp_probe.smtp_throttles.acquire", side_effect=TimeoutError
+        ):
+            (result,) = self.validate(server, ["jane@one.test"])
+
+        # The mail server wasn't asked, a retry later can tell
+        self.assertEqual(server.sessions, 0)
+        self.assertEqual(result["status"], "unknown")
+        self.assertTrue(result["is_greylisted"])
+        self.assertTrue(result["smtp_throttle_timeout"])
+
+    def test_endpoint(self):
+        client = app.test_client()
+        with mock.patch("app.API_KEY", "secret"), FakeSMTPServer(
+            mailboxes=["jane@one.test"]
+        ) as server, mock.patch("app.smtp_probe.SMTP_PORT", server.port):
+            response = client.post(
+                "/validate/batch",
+                json={"api_key": "secret", "emails": ["jane@one.test", "x@one.test"]},
+            )
+            unauthorized = client.post(
+                "/validate/batch", json={"api_key": "wrong", "emails": []}
+            )
+
+        self.assertEqual(response.status_code, 200)
+        results = response.get_json()["results"]
+        self.assertEqual([r["status"] for r in results], ["valid", "invalid"])
+        self.assertNotIn("smtp_response", results[0])
+        self.assertEqual(unauthorized.status_code, 401)
+
+    def test_iter_batch_results_works_in_windows(self):
+        addresses = [f"user{i}@one.test" for i in range(5)] + ["bad", "x@dead.test"]
+        with FakeSMTPServer(mailboxes=["user0@one.test"]) as server, mock.patch(
+            "app.smtp_probe.SMTP_PORT", server.port
+        ):
+            results = list(iter_batch_results(addresses, window_size=3))
+
+        self.assertEqual(sorted(index for index, _ in results), list(range(7)))
+        self.assertEqual(
+            {index: result["email"] for index, result in results},
+            dict(enumerate(addresses)),
+        )
+        # One session per window that has emails to check, over the same connection
+        self.assertEqual(server.sessions, 1)
+        self.assertEqual(server.commands.count("RSET"), 1)
+
+    def test_streaming_endpoint(self):
+        client = app.test_client()
+        addresses = ["jane@one.test", "bad", "john@one.test"]
+        with mock.patch("app.API_KEY", "secret"), FakeSMTPServer(
+            mailboxes=["jane@one.test"]
+        ) as server, mock.patch("app.smtp_probe.SMTP_PORT", server.port):
+            response = client.post(
+                "/validate/batch",
+                json={"api_key": "secret", "emails": addresses, "stream": True},
+            )
+            lines = [json.loads(line) for line in response.get_data().splitlines()]
+
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        statuses = {line["index"]: line["result"]["status"] for line in lines}
+        self.assertEqual(statuses, {0: "valid", 1: "invalid", 2: "invalid"})
+
+
+if __name__ == "__main__":
+    unittest.main()
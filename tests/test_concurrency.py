@@ -0,0 +1,29 @@
+import threading
+import time
+import unittest
+
+from app.concurrency import run_concurrently, spawn
+
+
+class TestConcurrency(unittest.TestCase):
+    def test_run_concurrently_overlaps_calls(self):
+        # Each function waits for the other two, so this only finishes if they run at the same time
+        barrier = threading.Barrier(3, timeout=5)
+
+        def lookup(value):
+            return lambda: (barrier.wait(), value)[1]
+
+        results = run_concurrently(lookup("ns"), lookup("cname"), lookup("mx"))
+        self.assertEqual(results, ["ns", "cname", "mx"])
+
+    def test_get_times_out(self):
+        task = spawn(time.sleep, 0.5)
+        with self.assertRaises(TimeoutError):
+            task.get(timeout=0.01)
+        self.assertFalse(task.ready())
+        task.get()
+        self.assertTrue(task.ready())
+
+
+if __name__ == "__main__":
+    unittest.main()
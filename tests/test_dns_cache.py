@@ -0,0 +1,117 @@
+import unittest
+from unittest import mock
+
+import dns.message
+import dns.name
+import dns.resolver
+
+from app.cache import TTLCache
+from app.dns_cache import DNSCache
+
+
+class FakeAnswer:
+    def __init__(self, ttl):
+        self.rrset = mock.Mock(ttl=ttl)
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = TTLCache(2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_expires_entries(self):
+        cache = TTLCache(10)
+        with mock.patch("app.cache.time.monotonic", return_value=100):
+            cache.set("a", 1, ttl=5)
+        with mock.patch("app.cache.time.monotonic", return_value=104):
+            self.assertEqual(cache.get("a"), 1)
+        with mock.patch("app.cache.time.monotonic", return_value=106):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+
+class TestDNSCache(unittest.TestCase):
+    def test_repeated_lookups_hit_the_cache(self):
+        cache = DNSCache(max_size=10)
+        answer = FakeAnswer(ttl=300)
+        with mock.patch("dns.resolver.resolve", return_value=answer) as resolve:
+            self.assertIs(cache.resolve("Gmail.com.", "MX"), answer)
+            self.assertIs(cache.resolve("gmail.com", "mx"), answer)
+        resolve.assert_called_once()
+        self.assertEqual(cache.stats()["answers"]["hits"], 1)
+        self.assertEqual(cache.stats()["answers"]["misses"], 1)
+
+    def test_zero_ttl_answers_are_not_cached(self):
+        cache = DNSCache(max_size=10)
+        with mock.patch(
+            "dns.resolver.resolve", return_value=FakeAnswer(ttl=0)
+        ) as resolve:
+            cache.resolve("example.com", "A")
+            cache.resolve("example.com", "A")
+        self.assertEqual(resolve.call_count, 2)
+
+    def test_nxdomain_is_cached_for_all_record_types(self):
+        cache = DNSCache(max_size=10)
+        error = dns.resolver.NXDOMAIN(qnames=[dns.name.from_text("gmial.com")])
+        with mock.patch("dns.resolver.resolve", side_effect=error) as resolve:
+            with self.assertRaises(dns.resolver.NXDOMAIN):
+                cache.resolve("gmial.com", "NS")
+            with self.assertRaises(dns.resolver.NXDOMAIN):
+                cache.resolve("gmial.com", "MX")
+        resolve.assert_called_once()
+        self.assertEqual(cache.stats()["negative_answers"]["size"], 1)
+
+    def test_each_cached_negative_answer_raises_a_new_error(self):
+        cache = DNSCache(max_size=10)
+        with mock.patch("dns.resolver.resolve", side_effect=dns.resolver.NoAnswer()):
+            errors = []
+            for _ in range(3):
+                try:
+                    cache.resolve("example.com", "MX")
+                except dns.resolver.NoAnswer as e:
+                    errors.append(e)
+
+        # The cache doesn't hold on to an error, nor to the frames of its traceback
+        self.assertIsNot(errors[1], errors[2])
+        self.assertIsNot(errors[0], errors[1])
+        self.assertIs(
+            cache.negative_answers.get(("example.com", "MX")), dns.resolver.NoAnswer
+        )
+
+    def test_negative_ttl_comes_from_the_soa_minimum(self):
+        cache = DNSCache(max_size=10, negative_ttl=300, negative_max_ttl=3600)
+        qname = dns.name.from_text("gmial.com")
+        response = dns.message.from_text(
+            "id 1\n"
+            "opcode QUERY\n"
+            "rcode NXDOMAIN\n"
+            ";QUESTION\n"
+            "gmial.com. IN MX\n"
+            ";AUTHORITY\n"
+            "com. 900 IN SOA a.gtld-servers.net. nstld.verisign-grs.com. "
+            "1 1800 900 604800 86\n"
+        )
+        error = dns.resolver.NXDOMAIN(qnames=[qname], responses={qname: response})
+        self.assertEqual(cache.get_negative_ttl(error), 86)
+        self.assertEqual(cache.get_negative_ttl(dns.resolver.NoNameservers()), 300)
+
+    def test_timeouts_are_not_cached(self):
+        cache = DNSCache(max_size=10)
+        with mock.patch(
+            "dns.resolver.resolve", side_effect=dns.resolver.LifetimeTimeout
+        ) as resolve:
+            for _ in range(2):
+                with self.assertRaises(dns.resolver.LifetimeTimeout):
+                    cache.resolve("example.com", "MX")
+        self.assertEqual(resolve.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
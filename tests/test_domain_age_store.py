@@ -0,0 +1,61 @@
+import datetime
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from app.domain_age_store import DomainAgeStore
+from app.validator import Email
+
+
+class TestDomainAgeStore(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = DomainAgeStore(os.path.join(directory.name, "ages.sqlite3"))
+
+    def test_round_trip(self):
+        creation_date = datetime.datetime(1997, 9, 15, tzinfo=datetime.timezone.utc)
+        self.assertEqual(self.store.get("google.com"), (False, None))
+
+        self.store.set("Google.com", creation_date)
+        self.store.set("unknown.dev", None)
+
+        self.assertEqual(self.store.get("google.com"), (True, creation_date))
+        self.assertEqual(self.store.get("unknown.dev"), (True, None))
+
+    def test_missing_creation_dates_expire(self):
+        self.store.set("unknown.dev", None)
+        self.store.missing_ttl = 0
+
+        self.assertEqual(self.store.get("unknown.dev"), (False, None))
+
+    def test_whois_runs_once_per_domain(self):
+        creation_date = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+        with mock.patch(
+            "app.validator.domain_age_store", self.store
+        ), mock.patch.object(
+            Email, "lookup_creation_date", return_value=creation_date
+        ) as lookup:
+            for address in ["a@example.com", "b@example.com"]:
+                email = Email(address)
+                email.domain, email.tld = "example", "com"
+                email.get_domain_age()
+                self.assertGreater(email.domain_age, 9000)
+
+        lookup.assert_called_once_with("example.com")
+
+    def test_failed_lookups_are_not_stored(self):
+        with mock.patch(
+            "app.validator.domain_age_store", self.store
+        ), mock.patch.object(Email, "lookup_creation_date", side_effect=TimeoutError):
+            email = Email("a@example.com")
+            email.domain, email.tld = "example", "com"
+            email.get_domain_age()
+
+        self.assertEqual(email.domain_age, -1)
+        self.assertEqual(self.store.get("example.com"), (False, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
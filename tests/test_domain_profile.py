@@ -0,0 +1,199 @@
+import threading
+import unittest
+from unittest import mock
+
+import dns.resolver
+
+from app.domain_profile import domain_profiles, catch_all_verdicts
+from app.validator import Email
+
+
+# Answers for a domain served by Google
+def fake_resolve(qname, rdtype):
+    record = mock.Mock()
+    record.exchange.to_text.return_value = "aspmx.l.google.com."
+    record.target.to_text.return_value = "mx.google.com."
+    record.address = "142.250.0.27"
+    if rdtype == "CNAME":
+        raise dns.resolver.NoAnswer()
+    return [record]
+
+
+def fake_smtp_response(code):
+    def make_bogus_smtp_connection(self, catch_all_test_email=None):
+        response = [
+            {
+                "code": "220",
+                "subcode": "",
+                "message": "mx.google.com ESMTP",
+                "stage": "banner",
+            },
+            {
+                "code": "250",
+                "subcode": "",
+                "message": "mx.google.com at your service",
+                "stage": "helo",
+            },
+            {"code": "250", "subcode": "2.1.0", "message": "OK", "stage": "mail"},
+            {"code": code, "subcode": "", "message": "OK", "stage": "rcpt"},
+        ]
+        if catch_all_test_email is not None and code == "250":
+            self.catch_all_smtp_response = {
+                "code": code,
+                "subcode": "",
+                "message": "OK",
+            }
+        response.append(
+            {"code": "221", "subcode": "2.0.0", "message": "closing", "stage": "quit"}
+        )
+        return response
+
+    return make_bogus_smtp_connection
+
+
+class TestDomainProfile(unittest.TestCase):
+    def setUp(self):
+        domain_profiles.clear()
+        catch_all_verdicts.clear()
+        patcher = mock.patch.object(Email, "get_domain_age", return_value=-1)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_domain_checks_run_once_per_domain(self):
+        with mock.patch(
+            "app.validator.resolve", side_effect=fake_resolve
+        ) as resolve, mock.patch.object(
+            Email,
+            "make_bogus_smtp_connection",
+            autospec=True,
+            side_effect=fake_smtp_response("550"),
+        ):
+            first = Email("first@example.com").validate()
+            lookups = resolve.call_count
+            second = Email("second@Example.com").validate()
+
+        self.assertEqual(resolve.call_count, lookups)
+        self.assertEqual(second["smtp_provider_host"], "aspmx.l.google.com")
+        self.assertEqual(second["email_provider"], "google")
+        self.assertEqual(second["fqdn"], "example.com")
+        self.assertEqual(first["smtp_provider_ip"], second["smtp_provider_ip"])
+        self.assertNotIn("_domain_profile", second)
+
+    def test_domain_facts_do_not_depend_on_its_case(self):
+        with mock.patch("app.validator.resolve", side_effect=fake_resolve):
+            first = Email("x@Gmail.com")
+            first.run_checks_before_smtp()
+            second = Email("y@gmail.com")
+            second.run_checks_before_smtp()
+
+        self.assertTrue(first.is_free_provider)
+        self.assertTrue(second.is_free_provider)
+        self.assertEqual(second.email_alias_stripped, "y@gmail.com")
+
+    def test_domain_verdict_is_reused(self):
+        error = dns.resolver.NXDOMAIN()
+        with mock.patch("app.validator.resolve", side_effect=error) as resolve:
+            Email("first@gmial.com").validate()
+            lookups = resolve.call_count
+            result = Email("second@gmial.com").validate()
+
+        self.assertEqual(resolve.call_count, lookups)
+        self.assertEqual(result["status"], "invalid")
+        self.assertEqual(
+            result["status_detail"], "email domain does not have name servers"
+        )
+
+    def test_dns_timeouts_are_not_reused(self):
+        def timing_out_mx(qname, rdtype):
+            if rdtype == "MX":
+                raise dns.resolver.LifetimeTimeout(timeout=5, errors=[])
+            return fake_resolve(qname, rdtype)
+
+        with mock.patch("app.validator.resolve", side_effect=timing_out_mx):
+            result = Email("first@gmail.com").validate()
+
+        self.assertEqual(result["status"], "unknown")
+        self.assertIsNone(domain_profiles.get("gmail.com"))
+
+        with mock.patch(
+            "app.validator.resolve", side_effect=fake_resolve
+        ), mock.patch.object(
+            Email,
+            "make_bogus_smtp_connection",
+            autospec=True,
+            side_effect=fake_smtp_response("250"),
+        ):
+            result = Email("second@gmail.com").validate()
+
+        self.assertEqual(result["status"], "valid")
+
+    def test_catch_all_is_tested_once_per_domain(self):
+        with mock.patch(
+            "app.validator.resolve", side_effect=fake_resolve
+        ), mock.patch.object(
+            Email,
+            "make_bogus_smtp_connection",
+            autospec=True,
+            side_effect=fake_smtp_response("250"),
+        ) as smtp:
+            first = Email("first@example.com").validate()
+            second = Email("second@example.com").validate()
+
+        # The catch-all probe is only sent in the first session
+        self.assertEqual(smtp.call_count, 2)
+        self.assertIsNotNone(smtp.call_args_list[0].args[1])
+        self.assertIsNone(smtp.call_args_list[1].args[1])
+        self.assertTrue(first["has_catch_all"])
+        self.assertTrue(second["has_catch_all"])
+
+    def test_deferred_catch_all_test_is_not_a_verdict(self):
+        def evaluate(catch_all_code):
+            email = Email("jane@example.com")
+            email.fqdn = "example.com"
+            email.smtp_response = fake_smtp_response("250")(email)
+            email.catch_all_smtp_response = {
+                "code": catch_all_code,
+                "subcode": "",
+                "message": "Try again later",
+            }
+            email.evaluate_smtp_response()
+            return email
+
+        self.assertFalse(evaluate("451").has_catch_all)
+        self.assertIsNone(catch_all_verdicts.get("example.com"))
+
+        self.assertFalse(evaluate("550").has_catch_all)
+        self.assertIs(catch_all_verdicts.get("example.com"), False)
+
+    def test_slow_domain_age_does_not_block_the_validation(self):
+        whois_done = threading.Event()
+
+        def slow_domain_age():
+            whois_done.wait(5)
+            return 4000
+
+        with mock.patch(
+            "app.validator.resolve", side_effect=fake_resolve
+        ), mock.patch.object(
+            Email,
+            "make_bogus_smtp_connection",
+            autospec=True,
+            side_effect=fake_smtp_response("550"),
+        ), mock.patch.object(
+            Email, "get_domain_age", side_effect=slow_domain_age
+        ), mock.patch(
+            "app.validator.DOMAIN_AGE_DEADLINE", 0.05
+        ):
+            first = Email("first@example.com").validate()
+            whois_done.set()
+            second = Email("second@example.com").validate()
+            third = Email("third@example.com").validate()
+
+        self.assertEqual(first["domain_age"], -1)
+        self.assertEqual(second["domain_age"], 4000)
+        self.assertEqual(third["domain_age"], 4000)
+        self.assertNotIn("_domain_age_task", first)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,171 @@
+import os
+import queue
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from app import app
+from app.job_store import JobStore
+from app.jobs import JobQueue, job_queue
+
+
+# A job store in a temporary directory, removed after the test
+def make_store(test):
+    directory = tempfile.TemporaryDirectory()
+    test.addCleanup(directory.cleanup)
+    return JobStore(os.path.join(directory.name, "jobs.sqlite3"))
+
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.store = make_store(self)
+
+    def test_results_are_added_as_they_finish(self):
+        release = threading.Event()
+
+        def fake_results(emails):
+            yield 1, {"email": emails[1]}
+            release.wait(5)
+            yield 0, {"email": emails[0]}
+
+        jobs = JobQueue(max_size=1, workers=1, store=self.store)
+        with mock.patch("app.jobs.iter_batch_results", side_effect=fake_results):
+            job = jobs.submit(["a@example.com", "b@example.com"])
+
+            job.wait(since=0, timeout=5)
+            partial = job.snapshot()
+            self.assertEqual(partial["status"], "running")
+            self.assertEqual(partial["results"], [(1, {"email": "b@example.com"})])
+
+            release.set()
+            while not job.is_done():
+                job.wait(since=len(job.results), timeout=5)
+
+        final = job.snapshot(since=1)
+        self.assertEqual(final["status"], "finished")
+        self.assertEqual(final["completed"], 2)
+        self.assertEqual(final["results"], [(0, {"email": "a@example.com"})])
+
+    def test_deferred_emails_are_retried_together(self):
+        checks = []
+
+        def fake_results(emails):
+            checks.append(emails)
+            for index, email in enumerate(emails):
+                yield index, {"email": email, "is_greylisted": email != "b@example.com"}
+
+        jobs = JobQueue(max_size=1, workers=1, store=self.store)
+        with mock.patch(
+            "app.jobs.iter_batch_results", side_effect=fake_results
+        ), mock.patch("app.jobs.GREYLIST_RETRY_DELAY", 0.2), mock.patch(
+            "app.jobs.GREYLIST_RETRY_BATCH_WINDOW", 0.1
+        ), mock.patch(
+            "app.jobs.GREYLIST_MAX_RETRIES", 2
+        ):
+            job = jobs.submit(["a@example.com", "b@example.com", "c@example.com"])
+
+            job.wait(since=0, timeout=5)
+            partial = job.snapshot()
+            self.assertEqual(partial["status"], "running")
+            self.assertEqual(partial["deferred"], 2)
+            self.assertEqual([index for index, _ in partial["results"]], [1])
+
+            while not job.is_done():
+                job.wait(since=len(job.results), timeout=5)
+
+        # Both deferred emails are checked again in one batch, and once more after that
+        self.assertEqual(
+            checks,
+            [
+                ["a@example.com", "b@example.com", "c@example.com"],
+                ["a@example.com", "c@example.com"],
+                ["a@example.com", "c@example.com"],
+            ],
+        )
+        final = job.snapshot()
+        self.assertEqual(final["status"], "finished")
+        self.assertEqual(final["deferred"], 0)
+        self.assertEqual(sorted(index for index, _ in final["results"][1:]), [0, 2])
+        self.assertTrue(
+            all(result["is_greylisted"] for _, result in final["results"][1:])
+        )
+
+    def test_queue_is_bounded(self):
+        jobs = JobQueue(max_size=1, workers=0, store=self.store)
+        jobs.submit(["a@example.com"])
+        with self.assertRaises(queue.Full):
+            jobs.submit(["b@example.com"])
+        self.assertEqual(jobs.stats()["queued"], 1)
+
+    def test_other_workers_read_the_job_from_the_store(self):
+        release = threading.Event()
+
+        def fake_results(emails):
+            release.wait(5)
+            yield 0, {"email": emails[0]}
+
+        jobs = JobQueue(max_size=1, workers=1, store=self.store)
+        other_worker = JobQueue(max_size=1, workers=0, store=self.store)
+        with mock.patch("app.jobs.iter_batch_results", side_effect=fake_results):
+            job = jobs.submit(["a@example.com"], {"debug": True})
+
+            snapshot = other_worker.snapshot(job.id)
+            self.assertIn(snapshot["status"], ("queued", "running"))
+            self.assertEqual(snapshot["results"], [])
+
+            # A poll with wait sees the result once the job adds it
+            threading.Timer(0.2, release.set).start()
+            snapshot = other_worker.snapshot(job.id, wait=5)
+            while not job.is_done():
+                job.wait(since=1, timeout=5)
+
+        self.assertEqual(snapshot["options"], {"debug": True})
+        self.assertEqual(snapshot["results"], [(0, {"email": "a@example.com"})])
+        self.assertIsNone(other_worker.snapshot("nope"))
+
+
+class TestJobEndpoints(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(job_queue, "store", make_store(self))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.client = app.test_client()
+        patcher = mock.patch("app.API_KEY", "secret")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_submit_and_poll(self):
+        def fake_results(emails):
+            for index, email in enumerate(emails):
+                yield index, {"email": email, "smtp_response": []}
+
+        with mock.patch("app.jobs.iter_batch_results", side_effect=fake_results):
+            response = self.client.post(
+                "/jobs", json={"api_key": "secret", "emails": ["a@example.com"]}
+            )
+            self.assertEqual(response.status_code, 202)
+            job_id = response.get_json()["id"]
+
+            poll = self.client.post(
+                f"/jobs/{job_id}", json={"api_key": "secret", "wait": 5}
+            ).get_json()
+
+            # The job writes its end to the store after its last result
+            job = job_queue.get(job_id)
+            while not job.is_done():
+                job.wait(since=1, timeout=5)
+
+        self.assertEqual(poll["total"], 1)
+        self.assertEqual(
+            poll["results"], [{"index": 0, "result": {"email": "a@example.com"}}]
+        )
+
+    def test_unknown_job(self):
+        response = self.client.post("/jobs/nope", json={"api_key": "secret"})
+        self.assertEqual(response.status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import unittest
+
+from app.knowledge_base import (
+    account_disabled_messages,
+    blacklist_messages,
+    invalid_email_messages,
+    mailbox_full_messages,
+)
+from app.phrase_matcher import PhraseMatcher
+from app.smtp_probe import SMTP_STAGES
+from app.validator import Email, smtp_message_phrases
+
+MESSAGES = [
+    "2.1.5 OK",
+    "5.1.1 The email account that you tried to reach does not exist",
+    "5.2.2 The email account that you tried to reach is over quota",
+    "5.2.1 The email account that you tried to reach is disabled",
+    "5.7.1 Service unavailable; client host blocked using Spamhaus",
+    "No such user here, mailbox unavailable",
+    "Access denied, banned sending IP [1.2.3.4]",
+]
+
+
+def reply(code, subcode="", message="OK"):
+    return {"code": code, "subcode": subcode, "message": message}
+
+
+class TestPhraseMatcher(unittest.TestCase):
+    def test_overlapping_phrases(self):
+        matcher = PhraseMatcher({"a": ["spam", "spamhaus", "hau"], "b": ["am"]})
+
+        self.assertEqual(
+            matcher.scan("listed by spamhaus"),
+            {"a": ["spam", "spamhaus", "hau"], "b": ["am"]},
+        )
+        self.assertEqual(matcher.scan("nothing here"), {})
+
+    def test_same_results_as_a_scan_per_phrase(self):
+        phrase_lists = {
+            "account_disabled": account_disabled_messages,
+            "mailbox_full": mailbox_full_messages,
+            "invalid_email": invalid_email_messages,
+            "blacklist": blacklist_messages,
+        }
+
+        for message in MESSAGES:
+            text = message.lower()
+            expected = {}
+            for name, phrases in phrase_lists.items():
+                found = [phrase for phrase in phrases if phrase.lower() in text]
+                if found:
+                    expected[name] = found
+
+            self.assertEqual(smtp_message_phrases.scan(text), expected, message)
+
+
+class TestEvaluateSMTPResponse(unittest.TestCase):
+    def evaluate(self, rcpt_reply):
+        return self.evaluate_session(
+            reply("220", message="mx.example.com ESMTP"),
+            reply("250"),
+            reply("250"),
+            rcpt_reply,
+            reply("221"),
+        )
+
+    # The replies of a session in the order of SMTP_STAGES, as far as it got
+    def evaluate_session(self, *replies):
+        email = Email("jane@example.com")
+        email.fqdn = "example.com"
+        email.smtp_response = [
+            dict(response, stage=stage) for stage, response in zip(SMTP_STAGES, replies)
+        ]
+        email.evaluate_smtp_response()
+        return email
+
+    def test_phrases_are_found_once_per_response(self):
+        email = self.evaluate(reply("550", "", "No such user here"))
+
+        self.assertEqual(email.status, "invalid")
+        self.assertEqual(
+            email.phrase_matches,
+            [(phrase, "No such user here") for phrase in ["no such user"] * 2],
+        )
+
+    def test_clear_codes_are_classified_without_phrases(self):
+        email = self.evaluate(reply("552", "5.2.2", "Sorry, no room"))
+
+        self.assertEqual(email.status, "valid")
+        self.assertTrue(email.is_mailbox_full)
+        self.assertEqual(email.phrase_matches, [])
+
+        # 5.7.1 is used for anything from relaying to blacklists, the phrases tell which
+        email = self.evaluate(reply("550", "5.7.1", "Client host blocked"))
+
+        self.assertEqual(email.status, "unknown")
+        self.assertEqual(email.phrase_matches, [("blocked", "Client host blocked")] * 2)
+
+    def test_address_in_the_message_is_ignored(self):
+        email = self.evaluate(reply("550", "", "<spam.trap@example.com> refused"))
+
+        self.assertEqual(email.status, "likely_invalid")
+        self.assertEqual(email.phrase_matches, [])
+
+    def test_only_the_stages_of_each_list_are_scanned(self):
+        email = self.evaluate_session(
+            reply("220", message="mx.example.com ESMTP No UCE, no spam"),
+            reply("250", message="Hello, spam is not tolerated"),
+            reply("250"),
+            reply("250", "2.1.5", "Recipient OK"),
+        )
+
+        self.assertEqual(email.status, "valid")
+        self.assertEqual(email.phrase_matches, [])
+
+    def test_session_refused_before_the_recipient(self):
+        email = self.evaluate_session(
+            reply("220", message="mx.example.com ESMTP"),
+            reply("250"),
+            reply("550", "", "Sender IP listed by Spamhaus"),
+        )
+
+        self.assertEqual(email.status, "unknown")
+        self.assertEqual(
+            email.status_detail, "email provider does not allow us to validate"
+        )
+
+        email = self.evaluate_session(reply("554", message="No SMTP service here"))
+
+        self.assertEqual(
+            email.status_detail, "email provider does not allow us to validate"
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+import threading
+import time
+import unittest
+
+from app.retry_scheduler import RetryScheduler
+
+
+class TestRetryScheduler(unittest.TestCase):
+    def test_runs_functions_when_they_are_due(self):
+        scheduler = RetryScheduler()
+        calls = []
+        done = threading.Event()
+
+        def call(name):
+            calls.append((name, time.monotonic() - started_at))
+            if len(calls) == 3:
+                done.set()
+
+        started_at = time.monotonic()
+        scheduler.schedule(0.3, call, "late")
+        scheduler.schedule(0.1, call, "early")
+        scheduler.schedule(0.2, call, "middle")
+
+        self.assertEqual(scheduler.stats(), {"scheduled": 3})
+        self.assertTrue(done.wait(5))
+        self.assertEqual([name for name, _ in calls], ["early", "middle", "late"])
+        self.assertGreaterEqual(calls[0][1], 0.1)
+        self.assertEqual(scheduler.stats(), {"scheduled": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
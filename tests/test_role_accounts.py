@@ -0,0 +1,44 @@
+import unittest
+
+from app.role_accounts import RoleAccounts, role_accounts
+
+
+class TestRoleAccounts(unittest.TestCase):
+    def test_exact_entries(self):
+        self.assertIn("info", role_accounts)
+        self.assertIn("Support", role_accounts)
+        self.assertIn("human_resources", role_accounts)
+
+        self.assertNotIn("jane", role_accounts)
+        self.assertNotIn("infos", role_accounts)
+        self.assertNotIn("", role_accounts)
+
+    def test_prefix_entries(self):
+        self.assertIn("all-staff", role_accounts)
+        self.assertIn("all.hands", role_accounts)
+        self.assertIn("sales_emea", role_accounts)
+
+        self.assertNotIn("allison", role_accounts)
+        self.assertNotIn("salesman", role_accounts)
+
+    def test_separator_variants(self):
+        self.assertIn("sales-team", role_accounts)
+        self.assertIn("hr.dept", role_accounts)
+        self.assertIn("human-resources", role_accounts)
+        self.assertIn("do_not_reply", role_accounts)
+
+        self.assertNotIn("jane.doe", role_accounts)
+        self.assertNotIn("john.hr", role_accounts)
+
+    def test_entries_sharing_a_prefix(self):
+        accounts = RoleAccounts(["no-", "noreply", "news"])
+
+        self.assertIn("no.reply", accounts)
+        self.assertIn("noreply", accounts)
+        self.assertIn("news.letter", accounts)
+        self.assertNotIn("nora", accounts)
+        self.assertNotIn("no", accounts)
+
+
+if __name__ == "__main__":
+    unittest.main()
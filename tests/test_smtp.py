@@ -0,0 +1,425 @@
+import socket
+import time
+import unittest
+from unittest import mock
+
+from app import app
+from app.domain_profile import catch_all_verdicts
+from app.smtp_probe import (
+    ReplyReader,
+    SMTPSession,
+    check_recipients,
+    parse_smtp_response,
+    smtp_pool,
+)
+from app.validator import Email
+from fake_smtp import FakeSMTPServer
+
+
+# An email on a domain whose mail server is the fake server
+def make_email(address, server, **options):
+    email = Email(address, **options)
+    email.fqdn = address.split("@")[1]
+    email.smtp_provider_host = "127.0.0.1"
+    return email
+
+
+class TestSMTPSession(unittest.TestCase):
+    def setUp(self):
+        catch_all_verdicts.clear()
+        smtp_pool.clear()
+
+    def evaluate(self, email, server):
+        with mock.patch("app.smtp_probe.SMTP_PORT", server.port):
+            email.evaluate_smtp_connection()
+        return email
+
+    def test_catch_all_probe_uses_the_same_session(self):
+        with FakeSMTPServer(catch_all=True) as server:
+            email = self.evaluate(make_email("jane@example.com", server), server)
+
+        self.assertEqual(server.sessions, 1)
+        self.assertEqual(email.status, "valid")
+        self.assertTrue(email.has_catch_all)
+        self.assertEqual(
+            [command.split(":")[0] for command in server.commands],
+            ["EHLO fancydomain.com", "MAIL FROM", "RCPT TO", "RCPT TO"],
+        )
+
+    def test_catch_all_probe_is_skipped_for_rejected_addresses(self):
+        with FakeSMTPServer(mailboxes=["jane@example.com"]) as server:
+            email = self.evaluate(make_email("john@example.com", server), server)
+
+        self.assertEqual(email.status, "invalid")
+        self.assertEqual(len([c for c in server.commands if c.startswith("RCPT")]), 1)
+        self.assertIsNone(catch_all_verdicts.get("example.com"))
+
+    def test_no_catch_all(self):
+        with FakeSMTPServer(mailboxes=["jane@example.com"]) as server:
+            email = self.evaluate(make_email("jane@example.com", server), server)
+
+        self.assertEqual(email.status, "valid")
+        self.assertFalse(email.has_catch_all)
+        self.assertIs(catch_all_verdicts.get("example.com"), False)
+
+    def test_greylisted(self):
+        with FakeSMTPServer(
+            rejection="451 4.7.1 Greylisted, please try again later"
+        ) as server:
+            email = self.evaluate(make_email("jane@example.com", server), server)
+
+        self.assertTrue(email.is_greylisted)
+        self.assertEqual(email.status, "unknown")
+        self.assertEqual(
+            email.status_detail, "email provider asked us to try again later"
+        )
+
+    def test_catch_all_verdict_is_reused(self):
+        catch_all_verdicts.set("example.com", True)
+        with FakeSMTPServer(mailboxes=["jane@example.com"]) as server:
+            email = self.evaluate(make_email("jane@example.com", server), server)
+
+        self.assertTrue(email.has_catch_all)
+        self.assertEqual(len([c for c in server.commands if c.startswith("RCPT")]), 1)
+
+    def test_catch_all_probe_is_skipped_when_time_is_short(self):
+        with FakeSMTPServer(catch_all=True) as server:
+            email = self.evaluate(
+                make_email("jane@example.com", server, time_budget=5), server
+            )
+
+        self.assertEqual(email.status, "valid")
+        self.assertEqual(email.skipped_stages, ["catch_all"])
+        self.assertEqual(len([c for c in server.commands if c.startswith("RCPT")]), 1)
+
+    def test_smtp_is_skipped_when_time_is_spent(self):
+        with FakeSMTPServer(catch_all=True) as server:
+            email = self.evaluate(
+                make_email("jane@example.com", server, time_budget=0), server
+            )
+
+        self.assertEqual(server.sessions, 0)
+        self.assertEqual(email.status, "unknown")
+        self.assertEqual(email.skipped_stages, ["smtp"])
+
+    def test_time_budget_must_be_a_finite_positive_number(self):
+        client = app.test_client()
+        with mock.patch("app.API_KEY", "secret"):
+            for time_budget in ["nan", "inf", "-inf", 0, "soon"]:
+                response = client.post(
+                    "/validate",
+                    json={
+                        "api_key": "secret",
+                        "email": "jane@example.com",
+                        "time_budget": time_budget,
+                    },
+                )
+                self.assertEqual(response.status_code, 400, time_budget)
+
+    def test_quit_reply_is_only_waited_for_when_debugging(self):
+        with FakeSMTPServer(catch_all=True) as server:
+            email = self.evaluate(make_email("jane@example.com", server), server)
+            debug_email = self.evaluate(
+                make_email("jane@example.com", server, debug=True), server
+            )
+
+        self.assertEqual(len(email.smtp_response), 4)
+        self.assertEqual(debug_email.smtp_response[4]["code"], "221")
+
+        # The debug check reused the pooled session and ended it
+        self.assertEqual(server.sessions, 1)
+        self.assertEqual(smtp_pool.stats()["idle"], 0)
+
+    def test_quit_reply_without_pooling(self):
+        with FakeSMTPServer(catch_all=True) as server, mock.patch(
+            "app.smtp_probe.SMTP_POOL_ENABLED", False
+        ):
+            email = self.evaluate(
+                make_email("jane@example.com", server, debug=True), server
+            )
+
+        self.assertEqual(email.smtp_response[4]["code"], "221")
+
+
+class TestDeadlines(unittest.TestCase):
+    def setUp(self):
+        smtp_pool.clear()
+        self.addCleanup(smtp_pool.clear)
+
+    def test_tarpitting_server_is_given_up_on(self):
+        with FakeSMTPServer(catch_all=True, delay=0.2) as server:
+            started_at = time.monotonic()
+            result = check_recipients(
+                "127.0.0.1", [("jane@example.com", None)], server.port, timeout=0.5
+            )
+            elapsed = time.monotonic() - started_at
+
+        self.assertLess(elapsed, 1)
+        self.assertEqual(len(result.greeting), 2)
+        self.assertIsNone(result.recipients["jane@example.com"])
+
+    def test_read_timeout(self):
+        with FakeSMTPServer(catch_all=True, delay=0.5) as server, mock.patch(
+            "app.smtp_probe.SMTP_READ_TIMEOUT", 0.1
+        ):
+            result = check_recipients(
+                "127.0.0.1", [("jane@example.com", None)], server.port
+            )
+
+        self.assertEqual(result.greeting, [])
+
+
+class TestPipelining(unittest.TestCase):
+    def setUp(self):
+        smtp_pool.clear()
+        self.addCleanup(smtp_pool.clear)
+
+    def check(self, server, recipients):
+        with mock.patch.object(
+            SMTPSession, "exchange", autospec=True, side_effect=SMTPSession.exchange
+        ) as exchange:
+            result = check_recipients("127.0.0.1", recipients, server.port)
+        return result, [call.args[1] for call in exchange.call_args_list]
+
+    def test_commands_are_sent_together(self):
+        recipients = [
+            ("jane@example.com", "test@example.com"),
+            ("john@example.com", "test@example.com"),
+            ("jane@example.org", "test@example.org"),
+        ]
+        with FakeSMTPServer(
+            mailboxes=["jane@example.com"], extensions=["PIPELINING", "8BITMIME"]
+        ) as server:
+            result, exchanges = self.check(server, recipients)
+
+        self.assertEqual(
+            exchanges,
+            [
+                ["EHLO fancydomain.com"],
+                [
+                    "MAIL FROM: <test@fancydomain.com>",
+                    "RCPT TO: <jane@example.com>",
+                    "RCPT TO: <test@example.com>",
+                    "RCPT TO: <john@example.com>",
+                    "RCPT TO: <jane@example.org>",
+                    "RCPT TO: <test@example.org>",
+                ],
+            ],
+        )
+        self.assertEqual(
+            {address: reply["code"] for address, reply in result.recipients.items()},
+            {
+                "jane@example.com": "250",
+                "john@example.com": "550",
+                "jane@example.org": "550",
+            },
+        )
+        self.assertEqual(result.catch_all_tests["test@example.com"]["code"], "550")
+        self.assertEqual(len(result.responses_for("jane@example.com")), 4)
+
+    def test_one_command_at_a_time_without_pipelining(self):
+        with FakeSMTPServer(mailboxes=["jane@example.com"]) as server:
+            _, exchanges = self.check(
+                server, [("jane@example.com", None), ("john@example.com", None)]
+            )
+
+        self.assertEqual([len(commands) for commands in exchanges], [1, 1, 1, 1])
+
+    def test_helo_when_ehlo_is_not_supported(self):
+        with FakeSMTPServer(mailboxes=["jane@example.com"], esmtp=False) as server:
+            result, _ = self.check(server, [("jane@example.com", None)])
+
+        self.assertEqual(
+            [command.split(" ")[0] for command in server.commands],
+            ["EHLO", "HELO", "MAIL", "RCPT"],
+        )
+        self.assertEqual(result.greeting[1]["code"], "250")
+        self.assertEqual(result.recipients["jane@example.com"]["code"], "250")
+
+
+class TestSMTPConnectionPool(unittest.TestCase):
+    def setUp(self):
+        smtp_pool.clear()
+        self.addCleanup(smtp_pool.clear)
+
+    def check(self, server, *addresses):
+        return check_recipients(
+            "127.0.0.1", [(address, None) for address in addresses], server.port
+        )
+
+    def test_sessions_are_reused_with_rset(self):
+        with FakeSMTPServer(mailboxes=["jane@example.com"]) as server:
+            first = self.check(server, "jane@example.com")
+            second = self.check(server, "john@example.com")
+
+        self.assertEqual(server.sessions, 1)
+        self.assertEqual(
+            [command.split(":")[0] for command in server.commands],
+            [
+                "EHLO fancydomain.com",
+                "MAIL FROM",
+                "RCPT TO",
+                "RSET",
+                "MAIL FROM",
+                "RCPT TO",
+            ],
+        )
+        # The banner and HELO replies of the session are reported for every check
+        self.assertEqual(
+            [
+                (response["stage"], response["message"])
+                for response in second.responses_for("john@example.com")[:2]
+            ],
+            [
+                ("banner", first.greeting[0]["message"]),
+                ("helo", first.greeting[1]["message"]),
+            ],
+        )
+        self.assertEqual(second.recipients["john@example.com"]["code"], "550")
+        self.assertEqual(smtp_pool.stats()["reused"], 1)
+
+    def test_sessions_are_retired_after_max_recipients(self):
+        with FakeSMTPServer(catch_all=True) as server, mock.patch(
+            "app.smtp_probe.SMTP_POOL_MAX_RECIPIENTS", 2
+        ):
+            first = self.check(server, "a@example.com", "b@example.com")
+            self.check(server, "c@example.com")
+
+        # QUIT is sent without waiting for its reply
+        self.assertIsNone(first.quit)
+        self.assertEqual(server.sessions, 2)
+
+    def test_idle_sessions_expire(self):
+        with FakeSMTPServer(catch_all=True) as server:
+            self.check(server, "a@example.com")
+            with mock.patch("app.smtp_probe.SMTP_POOL_IDLE_TIMEOUT", 0):
+                self.check(server, "b@example.com")
+
+        self.assertEqual(server.sessions, 2)
+        self.assertNotIn("RSET", server.commands)
+
+    def test_expired_sessions_of_other_servers_are_closed(self):
+        with FakeSMTPServer(catch_all=True) as first, FakeSMTPServer(
+            catch_all=True
+        ) as second:
+            self.check(first, "a@example.com")
+            (idle,) = smtp_pool.idle[("127.0.0.1", first.port)]
+            idle.last_used_at -= 60
+
+            self.check(second, "b@example.com")
+
+        self.assertNotIn(("127.0.0.1", first.port), smtp_pool.idle)
+        self.assertIsNone(idle.sock)
+
+    def test_idle_sessions_are_capped_across_servers(self):
+        with FakeSMTPServer(catch_all=True) as first, FakeSMTPServer(
+            catch_all=True
+        ) as second, mock.patch("app.smtp_probe.SMTP_POOL_MAX_IDLE", 1):
+            self.check(first, "a@example.com")
+            self.check(second, "b@example.com")
+
+        # The session of the first server was the least recently used
+        self.assertEqual(list(smtp_pool.idle), [("127.0.0.1", second.port)])
+        self.assertEqual(smtp_pool.stats()["idle"], 1)
+
+    def test_reset_of_an_idle_session_respects_the_deadline(self):
+        with FakeSMTPServer(catch_all=True) as server:
+            self.check(server, "a@example.com")
+
+            server.delay = 2
+            started_at = time.monotonic()
+            result = check_recipients(
+                "127.0.0.1", [("b@example.com", None)], server.port, timeout=0.3
+            )
+            elapsed = time.monotonic() - started_at
+
+        self.assertLess(elapsed, 1)
+        self.assertIsNone(result.recipients["b@example.com"])
+
+    def test_dropped_sessions_are_replaced(self):
+        with FakeSMTPServer(catch_all=True) as server:
+            self.check(server, "a@example.com")
+            for session in smtp_pool.idle[("127.0.0.1", server.port)]:
+                session.sock.shutdown(socket.SHUT_RDWR)
+            result = self.check(server, "b@example.com")
+
+        self.assertEqual(server.sessions, 2)
+        self.assertEqual(result.recipients["b@example.com"]["code"], "250")
+
+    def test_closing_sessions_are_not_kept(self):
+        with FakeSMTPServer(rejection="421 4.7.0 Try again later") as server:
+            result = check_recipients(
+                "127.0.0.1",
+                [("a@example.com", None)],
+                server.port,
+                wait_for_quit=True,
+            )
+
+        self.assertEqual(result.quit["code"], "221")
+        self.assertEqual(smtp_pool.stats()["idle"], 0)
+
+
+class TestReplies(unittest.TestCase):
+    def setUp(self):
+        self.client, self.server = socket.socketpair()
+        self.addCleanup(self.client.close)
+        self.addCleanup(self.server.close)
+        self.reader = ReplyReader(self.client)
+
+    def test_multi_line_reply_split_across_packets(self):
+        for chunk in [b"250-fake.test\r\n250-PIPE", b"LINING\r", b"\n250 8BITMIME\r\n"]:
+            self.server.sendall(chunk)
+        self.server.sendall(b"250 2.1.0 OK\r\n")
+
+        self.assertEqual(
+            self.reader.read_reply(),
+            "250-fake.test\r\n250-PIPELINING\r\n250 8BITMIME\r\n",
+        )
+        self.assertEqual(self.reader.read_reply(), "250 2.1.0 OK\r\n")
+
+    def test_reply_larger_than_a_packet(self):
+        lines = [f"550-5.1.1 {'x' * 100}\r\n" for _ in range(100)]
+        reply = "".join(lines) + "550 5.1.1 User unknown\r\n"
+        self.server.sendall(reply.encode())
+
+        self.assertEqual(self.reader.read_reply(), reply)
+
+    def test_connection_closed_mid_reply(self):
+        self.server.sendall(b"250-fake.test\r\n")
+        self.server.close()
+
+        with self.assertRaises(ConnectionError):
+            self.reader.read_reply()
+
+    def test_parse_multi_line_reply(self):
+        response = parse_smtp_response(
+            "550-5.1.1 The email account that you tried to reach does\r\n"
+            "550-5.1.1 not exist. Please try double-checking the recipient's\r\n"
+            "550 5.1.1 email address for typos. - gsmtp\r\n"
+        )
+
+        self.assertEqual(response["code"], "550")
+        self.assertEqual(response["subcode"], "5.1.1")
+        self.assertEqual(
+            response["message"],
+            "The email account that you tried to reach does not exist. Please try "
+            "double-checking the recipient's email address for typos. - gsmtp",
+        )
+
+    def test_parse_single_line_reply(self):
+        self.assertEqual(
+            parse_smtp_response("554 5.7.606 Access denied, banned sending IP\r\n"),
+            {
+                "code": "554",
+                "subcode": "5.7.606",
+                "message": "Access denied, banned sending IP",
+            },
+        )
+        self.assertEqual(
+            parse_smtp_response("220 fake.test ESMTP ready\r\n"),
+            {"code": "220", "subcode": "", "message": "fake.test ESMTP ready"},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
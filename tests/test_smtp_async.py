@@ -0,0 +1,104 @@
+import unittest
+from unittest import mock
+
+from app.smtp_async import AsyncSMTPEngine
+from app.smtp_probe import check_recipients, smtp_pool
+from fake_smtp import FakeSMTPServer
+
+
+class TestAsyncSMTPEngine(unittest.TestCase):
+    def setUp(self):
+        self.engine = AsyncSMTPEngine(max_sessions=5)
+
+    def test_same_replies_as_the_socket_engine(self):
+        recipients = [
+            ("jane@example.com", "test@example.com"),
+            ("john@example.com", None),
+        ]
+        with FakeSMTPServer(mailboxes=["jane@example.com"]) as server:
+            expected = check_recipients("127.0.0.1", recipients, server.port)
+            smtp_pool.clear()
+            result = self.engine.check_recipients(
+                "127.0.0.1", recipients, server.port, wait_for_quit=True
+            )
+
+        self.assertEqual(result.greeting, expected.greeting)
+        self.assertEqual(result.recipients, expected.recipients)
+        self.assertEqual(result.catch_all_tests, expected.catch_all_tests)
+        self.assertEqual(result.quit["code"], "221")
+
+    def test_multi_line_replies(self):
+        with FakeSMTPServer(
+            banner="220-fake.test ESMTP\r\n220 No UCE",
+            rejection="550-5.1.1 No such\r\n550 5.1.1 user",
+        ) as server:
+            result = self.engine.check_recipients(
+                "127.0.0.1", [("jane@example.com", None)], server.port
+            )
+
+        self.assertEqual(result.greeting[0]["message"], "fake.test ESMTP No UCE")
+        self.assertEqual(
+            result.recipients["jane@example.com"]["message"], "No such user"
+        )
+        self.assertIsNone(result.quit)
+
+    def test_pipelining(self):
+        recipients = [
+            ("jane@example.com", "test@example.com"),
+            ("john@example.com", None),
+        ]
+        with FakeSMTPServer(
+            mailboxes=["jane@example.com"], extensions=["PIPELINING"]
+        ) as server:
+            result = self.engine.check_recipients("127.0.0.1", recipients, server.port)
+
+        self.assertEqual(result.recipients["jane@example.com"]["code"], "250")
+        self.assertEqual(result.recipients["john@example.com"]["code"], "550")
+        self.assertEqual(result.catch_all_tests["test@example.com"]["code"], "550")
+
+    def test_check_many(self):
+        with FakeSMTPServer(catch_all=True) as server:
+            results = self.engine.check_many(
+                [
+                    ("127.0.0.1", [(f"user{i}@example.com", None)], server.port)
+                    for i in range(20)
+                ]
+            )
+
+        self.assertEqual(server.sessions, 20)
+        self.assertEqual(
+            [
+                result.recipients[f"user{i}@example.com"]["code"]
+                for i, result in enumerate(results)
+            ],
+            ["250"] * 20,
+        )
+
+    def test_connection_failure(self):
+        with FakeSMTPServer() as server:
+            port = server.port
+
+        result = self.engine.check_recipients(
+            "127.0.0.1", [("jane@example.com", None)], port
+        )
+        self.assertEqual(result.greeting, [])
+        self.assertIsNone(result.recipients["jane@example.com"])
+
+    def test_selected_by_config(self):
+        with FakeSMTPServer(catch_all=True) as server, mock.patch(
+            "app.smtp_probe.SMTP_ENGINE", "asyncio"
+        ), mock.patch(
+            "app.smtp_async.smtp_async_engine", self.engine
+        ), mock.patch.object(
+            self.engine, "check", wraps=self.engine.check
+        ) as check:
+            result = check_recipients(
+                "127.0.0.1", [("jane@example.com", None)], server.port
+            )
+
+        check.assert_called_once()
+        self.assertEqual(result.recipients["jane@example.com"]["code"], "250")
+
+
+if __name__ == "__main__":
+    unittest.main()
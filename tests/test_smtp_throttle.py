@@ -0,0 +1,141 @@
+import time
+import unittest
+from unittest import mock
+
+from app.smtp_probe import SMTPSessionResult, check_recipients, smtp_pool
+from app.smtp_throttle import SMTPThrottles, Throttle, is_throttled, smtp_throttles
+from fake_smtp import FakeSMTPServer
+
+
+def reply(code, subcode="", message="OK"):
+    return {"code": code, "subcode": subcode, "message": message}
+
+
+def make_result(*replies, banner="220 mx.example.com ESMTP", helo="Hello"):
+    result = SMTPSessionResult(["jane@example.com"])
+    result.greeting = [
+        reply("220", message=banner),
+        reply("250", message=helo),
+        reply("250"),
+    ]
+    for response in replies:
+        result.recipients["jane@example.com"] = response
+    return result
+
+
+class TestIsThrottled(unittest.TestCase):
+    def test_signals(self):
+        self.assertTrue(is_throttled(make_result(reply("421", "4.7.0", "Try later"))))
+        self.assertTrue(
+            is_throttled(make_result(reply("451", "4.7.1", "Rate limit exceeded")))
+        )
+        self.assertTrue(
+            is_throttled(make_result(reply("550", "5.7.1", "Listed by Spamhaus")))
+        )
+
+    def test_normal_replies(self):
+        self.assertFalse(is_throttled(make_result(reply("250", "2.1.5"))))
+        self.assertFalse(
+            is_throttled(make_result(reply("550", "5.1.1", "No such user")))
+        )
+
+        # Banners and EHLO replies often mention spam
+        self.assertFalse(
+            is_throttled(make_result(reply("250"), banner="220 No UCE or spam"))
+        )
+        self.assertFalse(
+            is_throttled(make_result(reply("250"), helo="mx1.spamexperts.com Hello"))
+        )
+
+        # The address in a rejection isn't part of the message
+        self.assertFalse(
+            is_throttled(
+                make_result(reply("550", "5.1.1", "<spam@x.com> User unknown"))
+            )
+        )
+
+
+class TestThrottle(unittest.TestCase):
+    def test_additive_increase_multiplicative_decrease(self):
+        with mock.patch("app.smtp_throttle.SMTP_RATE_INITIAL", 4):
+            throttle = Throttle(max_concurrency=2)
+
+        throttle.release(is_throttled=False)
+        self.assertEqual(throttle.rate, 4.5)
+        throttle.release(is_throttled=True)
+        self.assertEqual(throttle.rate, 2.25)
+
+        for _ in range(10):
+            throttle.release(is_throttled=True)
+        self.assertEqual(throttle.rate, 0.2)
+
+    def test_concurrency_and_rate(self):
+        with mock.patch("app.smtp_throttle.SMTP_RATE_INITIAL", 2):
+            throttle = Throttle(max_concurrency=3)
+
+        self.assertEqual(throttle.try_acquire(), 0)
+        self.assertEqual(throttle.try_acquire(), 0)
+
+        # The two tokens of the bucket are spent, the next one comes in about half a second
+        self.assertAlmostEqual(throttle.try_acquire(), 0.5, delta=0.05)
+
+        throttle.tokens = 10
+        self.assertEqual(throttle.try_acquire(), 0)
+        self.assertGreater(throttle.try_acquire(), 0)
+        self.assertEqual(throttle.active, 3)
+
+
+class TestSMTPThrottles(unittest.TestCase):
+    def setUp(self):
+        self.throttles = SMTPThrottles()
+
+    def test_provider_slots_are_shared_by_its_hosts(self):
+        with mock.patch("app.smtp_throttle.SMTP_PROVIDER_MAX_CONCURRENCY", 1):
+            self.assertEqual(
+                self.throttles.try_acquire("mx1.example.com", "example"), 0
+            )
+            self.assertGreater(
+                self.throttles.try_acquire("mx2.example.com", "example"), 0
+            )
+
+        # The slot taken on mx2 while waiting for the provider was given back
+        self.assertEqual(
+            self.throttles.throttles[("host", "mx2.example.com")].active, 0
+        )
+
+        self.throttles.release("mx1.example.com", "example", make_result(reply("250")))
+        self.assertEqual(self.throttles.try_acquire("mx2.example.com", "example"), 0)
+
+    def test_acquire_gives_up_at_the_deadline(self):
+        with mock.patch("app.smtp_throttle.SMTP_HOST_MAX_CONCURRENCY", 1):
+            self.throttles.acquire("mx.example.com")
+            with self.assertRaises(TimeoutError):
+                self.throttles.acquire(
+                    "mx.example.com", deadline=time.monotonic() + 0.1
+                )
+
+
+class TestCheckRecipients(unittest.TestCase):
+    def setUp(self):
+        smtp_pool.clear()
+        smtp_throttles.clear()
+        self.addCleanup(smtp_throttles.clear)
+
+    def test_server_asking_to_slow_down(self):
+        with FakeSMTPServer(rejection="421 4.7.0 Too many connections") as server:
+            check_recipients(
+                "127.0.0.1",
+                [("jane@example.com", None)],
+                server.port,
+                provider="example",
+            )
+
+        stats = smtp_throttles.stats()
+        self.assertEqual(stats["active"], 0)
+        self.assertEqual(
+            set(stats["slowed_down"]), {"host:127.0.0.1", "provider:example"}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import asyncio
+import datetime
+import socketserver
+import threading
+import time
+import unittest
+
+from app.whois_client import WhoisClient
+
+responses = {
+    # IANA referral for the TLD
+    "example": "% IANA WHOIS server\r\n\r\nrefer:        127.0.0.1\r\n",
+    "cansin.example": (
+        "Domain Name: CANSIN.EXAMPLE\r\n"
+        "Registry Domain ID: 1234\r\n"
+        "Creation Date: 2012-05-04T10:20:30Z\r\n"
+    ),
+    "new.example": "Domain Name: NEW.EXAMPLE\r\n",
+}
+
+
+# Stand-in for a whois server, it keeps the connection open after the response
+# so the client only returns early if it stops reading once it found the date
+class WhoisHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        query = self.request.recv(1024).decode().strip()
+        self.server.queries.append(query)
+        self.request.sendall(responses.get(query, "No match\r\n").encode())
+        if "Creation Date" in responses.get(query, ""):
+            time.sleep(1)
+
+
+class TestWhoisClient(unittest.TestCase):
+    def setUp(self):
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), WhoisHandler)
+        self.server.daemon_threads = True
+        self.server.queries = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.client = WhoisClient(
+            servers={},
+            iana_server="127.0.0.1",
+            port=self.server.server_address[1],
+            timeout=0.5,
+        )
+
+    def test_stops_reading_once_the_creation_date_is_found(self):
+        creation_date = self.client.lookup_creation_date("cansin.example")
+        self.assertEqual(
+            creation_date,
+            datetime.datetime(2012, 5, 4, 10, 20, 30, tzinfo=datetime.timezone.utc),
+        )
+        self.assertEqual(self.server.queries, ["example", "cansin.example"])
+
+    def test_referral_is_remembered(self):
+        self.client.lookup_creation_date("cansin.example")
+        self.client.lookup_creation_date("new.example")
+        self.assertEqual(
+            self.server.queries, ["example", "cansin.example", "new.example"]
+        )
+
+    def test_missing_creation_date(self):
+        self.assertIsNone(self.client.lookup_creation_date("new.example"))
+
+    def test_async_lookup(self):
+        creation_date = asyncio.run(
+            self.client.lookup_creation_date_async("cansin.example")
+        )
+        self.assertEqual(creation_date.year, 2012)
+
+
+if __name__ == "__main__":
+    unittest.main()